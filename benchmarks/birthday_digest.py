@@ -0,0 +1,65 @@
+"""
+Seed a database with users and contacts and measure a dry run of the birthday digest job
+
+Usage::
+
+    python -m benchmarks.birthday_digest [--users 1000] [--contacts 100] [--days 7]
+
+Without --db-url a temporary SQLite database is used. Postgres needs an empty database.
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.commands.birthday_digest import print_stats, send_digests
+from src.entity.models import Base, Contact, User, birthday_ordinal
+
+
+async def seed(engine, users: int, contacts: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User), [{"id": i, "username": f"user{i}", "email": f"user{i}@example.com",
+                                           "password": "password", "confirmed": True} for i in range(1, users + 1)])
+        for user_id in range(1, users + 1):
+            rows = []
+            for i in range(contacts):
+                birthday = date(1990, 1, 1) + timedelta(days=(user_id * 7 + i * 3) % 365)
+                rows.append({"first_name": f"first{i}", "second_name": f"second{i}", "email": f"c{i}@example.com",
+                             "birthday": birthday, "birthday_ordinal": birthday_ordinal(birthday),
+                             "add_info": "info", "user_id": user_id})
+            await conn.execute(insert(Contact), rows)
+
+
+async def run(url: str, users: int, contacts: int, days: int, batch_size: int):
+    engine = create_async_engine(url)
+    start = time.perf_counter()
+    await seed(engine, users, contacts)
+    print(f"seeded {users} users with {contacts} contacts each in {time.perf_counter() - start:.1f} s")
+    async with async_sessionmaker(engine)() as db:
+        stats = await send_digests(db, days, batch_size, dry_run=True)
+    print_stats(stats, dry_run=True)
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db-url", help="database URL, a temporary SQLite file by default")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--contacts", type=int, default=100, help="contacts per user")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.db_url or f"sqlite+aiosqlite:///{Path(tmp) / 'digest.db'}"
+        asyncio.run(run(url, args.users, args.contacts, args.days, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Measure rows per second of the contact list serialization paths at 10, 100 and 500 rows
+
+Usage::
+
+    python -m benchmarks.serialization [--seconds 1]
+
+Paths:
+
+- fastapi: what response_model=list[ContactResponse] does, validation, jsonable_encoder and json.dumps
+- adapter: validation and dump_json through a precompiled TypeAdapter
+- fast: Renderer with FAST_RESPONSES, fields copied from the rows and encoded without validation
+"""
+import argparse
+import json
+import time
+from collections import namedtuple
+from datetime import date, datetime
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from src.schemas.contact import ContactResponse
+from src.services import serializers
+from src.services.serializers import Renderer
+
+ContactRow = namedtuple("ContactRow", "id first_name second_name email birthday add_info user_id updated_at")
+
+
+def make_rows(count: int) -> list:
+    return [ContactRow(i, f"first{i}", f"second{i}", f"contact{i}@example.com", date(1990, 1, 1 + i % 28),
+                       "some additional info", 1, datetime(2026, 10, 18)) for i in range(count)]
+
+
+def rows_per_second(render, rows, seconds: float) -> float:
+    calls = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        render(rows)
+        calls += 1
+    return calls * len(rows) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=1, help="time spent per path and size")
+    args = parser.parse_args()
+
+    adapter = TypeAdapter(list[ContactResponse])
+    renderer = Renderer(ContactResponse, many=True)
+    paths = {
+        "fastapi": lambda rows: json.dumps(jsonable_encoder(adapter.validate_python(rows, from_attributes=True))),
+        "adapter": lambda rows: renderer.render(rows),
+        "fast": lambda rows: renderer.render(rows, fast=True),
+    }
+    print(f"encoder for the fast path: {'orjson' if serializers.orjson is not None else 'json'}")
+    print(f"{'rows':>6}" + "".join(f"{name:>14}" for name in paths) + f"{'fast/fastapi':>14}")
+    for count in (10, 100, 500):
+        rows = make_rows(count)
+        results = [rows_per_second(render, rows, args.seconds) for render in paths.values()]
+        print(f"{count:>6}" + "".join(f"{result:>14,.0f}" for result in results) + f"{results[2] / results[0]:>13.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Count SQL statements and time the contact and user write paths, before and after the switch to RETURNING
+
+Usage::
+
+    python -m benchmarks.write_path [--db-url sqlite+aiosqlite:///bench.db] [--requests 200]
+
+Without --db-url a temporary SQLite database is used. Postgres needs an empty database.
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.entity.models import Base, Contact, User
+from src.repository import contacts as repository_contacts
+from src.repository import users as repository_users
+from src.schemas.contact import ContactSchema, ContactUpdateSchema
+from src.schemas.user import UserSchema
+from src.services.cache import user_cache
+from src.services.invalidation import LocalInvalidationBus
+from src.services.response_cache import response_cache
+
+
+async def legacy_create_contact(body, db, current_user):
+    contact = Contact(first_name=body.first_name, second_name=body.second_name, email=body.email,
+                      birthday=body.birthday, add_info=body.add_info, user_id=current_user.id)
+    db.add(contact)
+    await db.commit()
+    await db.refresh(contact)
+    return contact
+
+
+async def legacy_update_contact(contact_id, body, db, current_user):
+    result = await db.execute(select(Contact).filter(Contact.user_id == current_user.id).filter_by(id=contact_id))
+    contact = result.scalar_one_or_none()
+    if contact:
+        contact.first_name = body.first_name
+        contact.second_name = body.second_name
+        contact.email = body.email
+        contact.birthday = body.birthday
+        contact.add_info = body.add_info
+        await db.commit()
+        await db.refresh(contact)
+    return contact
+
+
+async def legacy_create_user(body, db):
+    new_user = User(**body.model_dump())
+    db.add(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    return new_user
+
+
+async def legacy_update_avatar_url(email, url, db):
+    user = (await db.execute(select(User).filter_by(email=email))).scalar_one_or_none()
+    user.avatar = url
+    await db.commit()
+    await db.refresh(user)
+    return user
+
+
+async def run(url: str, requests: int):
+    # measure the database only, cache invalidation stays in process
+    user_cache.client = None
+    user_cache.attach(LocalInvalidationBus())
+    response_cache.client = None
+    engine = create_async_engine(url)
+    # the old write path relied on attributes expiring on commit, the new one does not care
+    session_maker = async_sessionmaker(engine, autoflush=False, expire_on_commit=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    body = ContactSchema(first_name="first", second_name="second", email="contact@example.com",
+                         birthday=date(1990, 5, 17), add_info="info", user_id=0)
+    update_body = ContactUpdateSchema(**body.model_dump(), completed=True)
+    counter = iter(range(10 ** 9))
+
+    def user_body():
+        number = next(counter)
+        return UserSchema(username=f"user{number}", email=f"user{number}@example.com", password="password")
+
+    async with session_maker() as db:
+        owner = await repository_users.create_user(user_body(), db)
+    paths = {
+        "create_contact": (lambda db: legacy_create_contact(body, db, owner),
+                           lambda db: repository_contacts.create_contact(body, db, owner)),
+        "update_contact": (lambda db: legacy_update_contact(1, update_body, db, owner),
+                           lambda db: repository_contacts.update_contact(1, update_body, db, owner)),
+        "create_user": (lambda db: legacy_create_user(user_body(), db),
+                        lambda db: repository_users.create_user(user_body(), db)),
+        "update_avatar_url": (lambda db: legacy_update_avatar_url(owner.email, "avatar", db),
+                              lambda db: repository_users.update_avatar_url(owner.email, "avatar", db)),
+    }
+
+    print(f"{'path':<20}{'before stmts':>14}{'after stmts':>13}{'before ms':>12}{'after ms':>11}")
+    for name, (before, after) in paths.items():
+        row = []
+        for call in (before, after):
+            statements.clear()
+            async with session_maker() as db:
+                await call(db)
+            row.append(sum(1 for statement in statements if not statement.startswith(("BEGIN", "COMMIT"))))
+        for call in (before, after):
+            start = time.perf_counter()
+            for _ in range(requests):
+                async with session_maker() as db:
+                    await call(db)
+            row.append((time.perf_counter() - start) / requests * 1000)
+        print(f"{name:<20}{row[0]:>14}{row[1]:>13}{row[2]:>12.3f}{row[3]:>11.3f}")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db-url", help="database URL, a temporary SQLite file by default")
+    parser.add_argument("--requests", type=int, default=200, help="calls per path for the timings")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.db_url or f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}"
+        asyncio.run(run(url, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,16 @@ from fastapi_limiter import FastAPILimiter
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.middleware.cors import CORSMiddleware
+from starlette.staticfiles import StaticFiles
 
 from src.conf.config import config
 from src.database.db import get_db
 from src.routes import contacts
-from src.routes import auth, users
+from src.routes import auth, users, metrics
+from src.services.cache import invalidation_bus
+from src.services.mailer import mailer
+from src.services.passwords import password_hasher
+from src.services.rate_limit import rate_limiter
 
 app = FastAPI()
 
@@ -22,18 +27,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "ETag", "Last-Modified"],
 )
 
 
 app.include_router(auth.router, prefix="/api")
 app.include_router(users.router, prefix="/api")
 app.include_router(contacts.router, prefix="/api")
+app.include_router(metrics.router, prefix="/api")
+
+if config.AVATAR_STORAGE == 'local':
+    app.mount(config.AVATAR_LOCAL_URL, StaticFiles(directory=config.AVATAR_LOCAL_DIR, check_dir=False),
+              name="avatars")
 
 
 @app.on_event("startup")
 async def startup():
     r = await redis.Redis(host=config.REDIS_DOMAIN, port=config.REDIS_PORT, db=0, password=config.REDIS_PASSWORD)
     await FastAPILimiter.init(r)
+    await invalidation_bus.start()
+    await mailer.start()
+    if config.RATE_LIMITER == 'local':
+        await rate_limiter.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    password_hasher.shutdown()
+    await invalidation_bus.stop()
+    await mailer.stop()
+    await rate_limiter.stop()
 
 
 @app.get("/")
@@ -0,0 +1,26 @@
+"""add contacts keyset index
+
+Revision ID: 3c9e5a1d7b42
+Revises: 671d45305f76
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9e5a1d7b42'
+down_revision: Union[str, None] = '671d45305f76'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_todos_user_id_id', 'todos', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_todos_user_id_id', table_name='todos')
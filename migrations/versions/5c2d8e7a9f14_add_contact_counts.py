@@ -0,0 +1,33 @@
+"""add contact counts
+
+Revision ID: 5c2d8e7a9f14
+Revises: e91c07b5d2f8
+Create Date: 2026-10-18 15:02:41.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2d8e7a9f14'
+down_revision: Union[str, None] = 'e91c07b5d2f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('contact_counts',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.execute("INSERT INTO contact_counts (user_id, count) "
+               "SELECT user_id, count(*) FROM todos WHERE user_id IS NOT NULL GROUP BY user_id")
+
+
+def downgrade() -> None:
+    op.drop_table('contact_counts')
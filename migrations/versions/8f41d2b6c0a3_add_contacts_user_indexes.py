@@ -0,0 +1,32 @@
+"""add contacts user indexes
+
+Revision ID: 8f41d2b6c0a3
+Revises: 3c9e5a1d7b42
+Create Date: 2026-10-18 11:02:17.540129
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f41d2b6c0a3'
+down_revision: Union[str, None] = '3c9e5a1d7b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_todos_user_id_first_name', 'todos', ['user_id', 'first_name'], unique=False)
+    op.create_index('ix_todos_user_id_second_name', 'todos', ['user_id', 'second_name'], unique=False)
+    op.create_index('ix_todos_user_id_email', 'todos', ['user_id', 'email'], unique=False)
+    op.create_index('ix_todos_user_id_birthday', 'todos', ['user_id', 'birthday'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_todos_user_id_birthday', table_name='todos')
+    op.drop_index('ix_todos_user_id_email', table_name='todos')
+    op.drop_index('ix_todos_user_id_second_name', table_name='todos')
+    op.drop_index('ix_todos_user_id_first_name', table_name='todos')
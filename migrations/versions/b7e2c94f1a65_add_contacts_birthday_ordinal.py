@@ -0,0 +1,31 @@
+"""add contacts birthday ordinal
+
+Revision ID: b7e2c94f1a65
+Revises: 8f41d2b6c0a3
+Create Date: 2026-10-18 11:47:05.902311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2c94f1a65'
+down_revision: Union[str, None] = '8f41d2b6c0a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('todos', sa.Column('birthday_ordinal', sa.SmallInteger(), nullable=True))
+    op.execute("UPDATE todos SET birthday_ordinal = EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday)")
+    op.create_index('ix_todos_user_id_birthday_ordinal', 'todos', ['user_id', 'birthday_ordinal'], unique=False)
+    op.drop_index('ix_todos_user_id_birthday', table_name='todos')
+
+
+def downgrade() -> None:
+    op.create_index('ix_todos_user_id_birthday', 'todos', ['user_id', 'birthday'], unique=False)
+    op.drop_index('ix_todos_user_id_birthday_ordinal', table_name='todos')
+    op.drop_column('todos', 'birthday_ordinal')
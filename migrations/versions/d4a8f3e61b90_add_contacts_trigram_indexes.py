@@ -0,0 +1,31 @@
+"""add contacts trigram indexes
+
+Revision ID: d4a8f3e61b90
+Revises: b7e2c94f1a65
+Create Date: 2026-10-18 12:31:48.117462
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a8f3e61b90'
+down_revision: Union[str, None] = 'b7e2c94f1a65'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    for column in ('first_name', 'second_name', 'email'):
+        op.create_index(f'ix_todos_user_id_{column}_trgm', 'todos', ['user_id', column], unique=False,
+                        postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    for column in ('first_name', 'second_name', 'email'):
+        op.drop_index(f'ix_todos_user_id_{column}_trgm', table_name='todos')
@@ -0,0 +1,28 @@
+"""add contacts external id
+
+Revision ID: e91c07b5d2f8
+Revises: d4a8f3e61b90
+Create Date: 2026-10-18 13:20:09.664815
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e91c07b5d2f8'
+down_revision: Union[str, None] = 'd4a8f3e61b90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('todos', sa.Column('external_id', sa.String(length=64), nullable=True))
+    op.create_index('ix_todos_user_id_external_id', 'todos', ['user_id', 'external_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_todos_user_id_external_id', table_name='todos')
+    op.drop_column('todos', 'external_id')
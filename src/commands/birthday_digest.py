@@ -0,0 +1,124 @@
+"""
+Email every user a digest of the upcoming birthdays of their contacts
+
+Usage::
+
+    python -m src.commands.birthday_digest [--days 7] [--batch-size 100] [--dry-run]
+
+Meant to run once a night, e.g. from cron::
+
+    0 6 * * * cd /app && python -m src.commands.birthday_digest
+"""
+import argparse
+import asyncio
+import time
+from datetime import date
+
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.repository.contacts import stream_upcoming_birthdays
+from src.services.email import send_birthday_digests
+from src.services.mailer import mailer
+
+
+def next_birthday(birthday: date, today: date) -> date:
+    """
+    Date of the next birthday from today on, Feb 29 birthdays fall on Mar 1 in common years
+
+    :param birthday: date: Birthday
+    :param today: date: First day to consider
+    :return: date: Next birthday
+    """
+    for year in (today.year, today.year + 1):
+        try:
+            upcoming = birthday.replace(year=year)
+        except ValueError:
+            upcoming = date(year, 3, 1)
+        if upcoming >= today:
+            return upcoming
+
+
+async def collect_digests(partitions, today: date, batch_size: int):
+    """
+    Group the streamed rows into one digest per user and yield the digests in batches.
+    Rows arrive ordered by user, so only the digest of the current user is kept open.
+
+    :param partitions: AsyncIterator[list[Row]]: Rows from stream_upcoming_birthdays
+    :param today: date: First day of the window
+    :param batch_size: int: Number of digests per batch
+    :return: AsyncIterator[list[dict]]: Digests with email, username and contacts
+    """
+    batch = []
+    digest = None
+    async for rows in partitions:
+        for row in rows:
+            if digest is None or digest["user_id"] != row.user_id:
+                if digest is not None:
+                    batch.append(digest)
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+                digest = {"user_id": row.user_id, "email": row.email, "username": row.username, "contacts": []}
+            upcoming = next_birthday(row.birthday, today)
+            digest["contacts"].append({"first_name": row.first_name, "second_name": row.second_name,
+                                       "date": upcoming.isoformat(), "days": (upcoming - today).days})
+    if digest is not None:
+        batch.append(digest)
+    if batch:
+        yield batch
+
+
+async def send_digests(db, days: int, batch_size: int, dry_run: bool = False, today: date | None = None) -> dict:
+    """
+    Build the digests of all users in one streaming query and send them batch by batch
+
+    :param db: AsyncSession: Pass the database session
+    :param days: int: Number of days to look ahead
+    :param batch_size: int: Number of digests handed to the mailer at once
+    :param dry_run: bool: Build the digests without sending them
+    :param today: date: First day of the window, defaults to today
+    :return: dict: Numbers of users, contacts and queued digests and the elapsed seconds
+    """
+    today = today or date.today()
+    stats = {"users": 0, "contacts": 0, "queued": 0, "seconds": 0.0}
+    start = time.perf_counter()
+    partitions = stream_upcoming_birthdays(today, days, db, batch_size=max(batch_size, 1000))
+    async for batch in collect_digests(partitions, today, batch_size):
+        stats["users"] += len(batch)
+        stats["contacts"] += sum(len(digest["contacts"]) for digest in batch)
+        if not dry_run:
+            stats["queued"] += await send_birthday_digests(batch, days)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def print_stats(stats: dict, dry_run: bool):
+    seconds = stats["seconds"] or 1e-9
+    print(f"users={stats['users']} contacts={stats['contacts']} queued={stats['queued']}"
+          f"{' (dry run)' if dry_run else ''}")
+    print(f"{stats['seconds']:.3f} s, {stats['contacts'] / seconds:,.0f} contacts/s, "
+          f"{stats['users'] / seconds:,.0f} digests/s")
+
+
+async def run(days: int, batch_size: int, dry_run: bool):
+    await mailer.start()
+    async with sessionmanager.session() as db:
+        stats = await send_digests(db, days, batch_size, dry_run)
+    # wait until the pooled mailer delivered the queued digests
+    await mailer.stop(timeout=3600)
+    print_stats(stats, dry_run)
+    print(f"mailer: {mailer.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=int, default=config.BIRTHDAY_DIGEST_DAYS, help="days to look ahead")
+    parser.add_argument("--batch-size", type=int, default=config.BIRTHDAY_DIGEST_BATCH_SIZE,
+                        help="digests handed to the mailer at once")
+    parser.add_argument("--dry-run", action="store_true", help="build the digests and report throughput only")
+    args = parser.parse_args()
+    asyncio.run(run(args.days, args.batch_size, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
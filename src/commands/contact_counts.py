@@ -0,0 +1,100 @@
+"""
+Reconcile the stored per-user contact counts with the contacts table
+
+Usage::
+
+    python -m src.commands.contact_counts reconcile [--dry-run]
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from src.database.db import sessionmanager
+from src.entity.models import Contact, ContactCount
+from src.services.response_cache import response_cache
+
+
+async def count_drift(db) -> list[tuple[int, int, int]]:
+    """
+    Compare the stored counts with one grouped count over the contacts table
+
+    :param db: AsyncSession: Pass the database session
+    :return: list[tuple[int, int, int]]: User id, stored count and actual count of every user that drifted
+    """
+    actual = dict((await db.execute(
+        select(Contact.user_id, func.count()).filter(Contact.user_id.is_not(None)).group_by(Contact.user_id))).all())
+    stored = dict((await db.execute(select(ContactCount.user_id, ContactCount.count))).all())
+    return [(user_id, stored.get(user_id, 0), actual.get(user_id, 0))
+            for user_id in sorted(actual.keys() | stored.keys())
+            if stored.get(user_id, 0) != actual.get(user_id, 0)]
+
+
+async def recount_user(user_id: int, db) -> int:
+    """
+    Recount the contacts of one user and store the count in its own short transaction.
+    The counter row is locked before counting, so a create or delete running at the same time either committed
+    before and is counted, or waits for the lock and adds its delta to the new count afterwards.
+    The cached responses of the user carry the old count and are invalidated.
+
+    :param user_id: int: Id of the user
+    :param db: AsyncSession: Pass the database session
+    :return: int: Stored count
+    """
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    await db.execute(dialect.insert(ContactCount).values(user_id=user_id, count=0)
+                     .on_conflict_do_nothing(index_elements=[ContactCount.user_id]))
+    await db.execute(select(ContactCount.count).filter(ContactCount.user_id == user_id).with_for_update())
+    actual = (await db.execute(
+        select(func.count()).select_from(Contact).filter(Contact.user_id == user_id))).scalar_one()
+    await db.execute(update(ContactCount).filter(ContactCount.user_id == user_id).values(count=actual),
+                     execution_options={"synchronize_session": False})
+    await db.commit()
+    await response_cache.bump(user_id)
+    return actual
+
+
+async def reconcile_counts(db, dry_run: bool = False) -> list[tuple[int, int, int]]:
+    """
+    Find the drifted counts and recount every drifted user under a lock of its counter row
+
+    :param db: AsyncSession: Pass the database session
+    :param dry_run: bool: Only report the drift
+    :return: list[tuple[int, int, int]]: User id, stored count and actual count of every drifted user,
+        the actual count as stored by the fix
+    """
+    drift = await count_drift(db)
+    if dry_run or not drift:
+        return drift
+    # the drift scan ran in its own transaction, release it before taking row locks user by user
+    await db.commit()
+    return [(user_id, stored, await recount_user(user_id, db)) for user_id, stored, _ in drift]
+
+
+async def reconcile(dry_run: bool):
+    """
+    Print and fix the drift between stored and actual contact counts
+
+    :param dry_run: bool: Only print the drift
+    :return: None
+    """
+    async with sessionmanager.session() as db:
+        drift = await reconcile_counts(db, dry_run)
+    for user_id, stored, actual in drift:
+        print(f"user_id={user_id:<10} stored={stored:<10} actual={actual}")
+    action = "found" if dry_run else "fixed"
+    print(f"{action} {len(drift)} drifted counts")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    reconcile_parser = commands.add_parser("reconcile", help="recount contacts and fix drifted counters")
+    reconcile_parser.add_argument("--dry-run", action="store_true", help="only report the drift")
+    args = parser.parse_args()
+    asyncio.run(reconcile(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
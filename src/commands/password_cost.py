@@ -0,0 +1,77 @@
+"""
+Tune and inspect the bcrypt cost of stored passwords
+
+Usage::
+
+    python -m src.commands.password_cost calibrate [--target-ms 250]
+    python -m src.commands.password_cost report
+"""
+import argparse
+import asyncio
+from collections import Counter
+
+from sqlalchemy import select
+
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.entity.models import User
+from src.services.passwords import calibrate_rounds, get_rounds
+
+
+def calibrate(target_ms: float):
+    """
+    Print hash times per bcrypt cost and the cost to put into BCRYPT_ROUNDS
+
+    :param target_ms: float: Latency budget of a single hash in milliseconds
+    :return: None
+    """
+    rounds, timings = calibrate_rounds(target_ms)
+    for cost, ms in timings.items():
+        print(f"rounds={cost:<3} {ms:10.1f} ms")
+    print(f"BCRYPT_ROUNDS={rounds} (target {target_ms} ms, current {config.BCRYPT_ROUNDS})")
+
+
+async def cost_distribution(db) -> Counter:
+    """
+    Count users per bcrypt cost of their password hash
+
+    :param db: AsyncSession: Pass the database session
+    :return: Counter: Number of users per cost, None for hashes that are not bcrypt
+    """
+    distribution = Counter()
+    result = await db.stream_scalars(select(User.password).execution_options(yield_per=1000))
+    async for password in result:
+        distribution[get_rounds(password)] += 1
+    return distribution
+
+
+async def report():
+    """
+    Print the distribution of bcrypt costs across users
+
+    :return: None
+    """
+    async with sessionmanager.session() as db:
+        distribution = await cost_distribution(db)
+    total = sum(distribution.values())
+    for cost, count in sorted(distribution.items(), key=lambda item: (item[0] is None, item[0])):
+        marker = " (current)" if cost == config.BCRYPT_ROUNDS else ""
+        print(f"rounds={cost!s:<4} {count:>10} {count / total:7.1%}{marker}")
+    print(f"total {total} users, rehashed to rounds={config.BCRYPT_ROUNDS} on next login")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    calibrate_parser = commands.add_parser("calibrate", help="pick bcrypt rounds for a latency target")
+    calibrate_parser.add_argument("--target-ms", type=float, default=config.BCRYPT_TARGET_MS)
+    commands.add_parser("report", help="show bcrypt cost distribution across users")
+    args = parser.parse_args()
+    if args.command == "calibrate":
+        calibrate(args.target_ms)
+    else:
+        asyncio.run(report())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,12 @@
 ACCOUNT_EXISTS = 'Account already exists'
 EMAIL_NOT_CONFIRMED = 'Email not confirmed'
 INVALID_EMAIL = "Invalid email"
-INVALID_PASSWORD = "Invalid password"
\ No newline at end of file
+INVALID_PASSWORD = "Invalid password"
+PASSWORD_SERVICE_BUSY = "Password service is busy, try again later"
+INVALID_CURSOR = "Invalid cursor"
+UNSUPPORTED_IMPORT_FORMAT = "Unsupported import format, use csv or ndjson"
+INVALID_AVATAR = "Avatar must be a PNG, JPEG, GIF or WebP image"
+AVATAR_TOO_LARGE = "Avatar file is too large"
+TOO_MANY_REQUESTS = "Too Many Requests"
+TOKEN_SERVICE_UNAVAILABLE = "Token service is unavailable, try again later"
+INVALID_METRICS_TOKEN = "Invalid metrics token"
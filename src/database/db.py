@@ -1,21 +1,254 @@
 import contextlib
+import itertools
+import time
+from bisect import bisect_left
 
+from fastapi import Request
+from jose import JWTError, jwt
+from redis.exceptions import RedisError
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from src.conf.config import config
+from src.services.cache import LRUCache, redis_client
+
+
+class PoolStats:
+    """
+    Checkout counters and wait time histogram of a connection pool
+
+    :param buckets: tuple: Upper bounds of the wait time buckets in seconds
+    """
+
+    buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+    def __init__(self):
+        self.histogram = [0] * (len(self.buckets) + 1)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+
+    def observe(self, seconds: float):
+        self.histogram[bisect_left(self.buckets, seconds)] += 1
+        self.checkouts += 1
+        self.wait_total += seconds
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{bucket}" for bucket in self.buckets] + ["le_inf"]
+        return {"checkouts": self.checkouts, "timeouts": self.timeouts, "wait_seconds_total": self.wait_total,
+                "wait_histogram": dict(zip(labels, self.histogram))}
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long every checkout waited and how many timed out
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.observe(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def engine_options(url: str) -> dict:
+    """
+    Build create_async_engine keyword arguments from the pool settings
+
+    :param url: str: Database URL
+    :return: dict: Engine options
+    """
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+    }
+    if url.get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": config.DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+class PinningSession(AsyncSession):
+    """
+    Session that awaits the read-your-writes pin of its client after every commit, before the response is sent
+    """
+
+    async def commit(self):
+        await super().commit()
+        pin = self.info.get("pin")
+        if pin is not None:
+            await pin()
 
 
 class DatabaseSessionManager:
-    def __init__(self, url: str):
-        self._engine: AsyncEngine | None = create_async_engine(url)
+    """
+    Sessions on a primary engine and optional read replicas
+
+    Read sessions go to a healthy replica in turn. A replica that fails to connect is skipped for cooldown seconds.
+    After a write session with a key commits, read sessions with the same key use the primary for
+    read_your_writes_window seconds, so a client sees its own changes despite replication lag.
+    The pins are kept in Redis, so they hold on every worker, and in process for the writes of this worker.
+
+    :param url: str: Database URL of the primary
+    :param replica_urls: list[str]: Database URLs of the replicas
+    :param cooldown: float: Seconds a failed replica is skipped
+    :param read_your_writes_window: float: Seconds reads stay on the primary after a write
+    :param read_your_writes_size: int: Maximum number of pinned clients kept in memory
+    :param client: redis.Redis | None: Async Redis client shared by the workers, None keeps pins in process
+    :param options: Engine options, built from the pool settings when omitted
+    """
+
+    pin_prefix = "read-your-writes:"
+
+    def __init__(self, url: str, replica_urls=(), cooldown: float = 30, read_your_writes_window: float = 5,
+                 read_your_writes_size: int = 10000, client=None, **options):
+        self._engine: AsyncEngine | None = create_async_engine(url, **(options or engine_options(url)))
+        # writes build their results from RETURNING rows, nothing has to be reloaded after a commit
         self._session_maker: async_sessionmaker = async_sessionmaker(autoflush=False, autocommit=False,
-                                                                     bind=self._engine)
+                                                                     expire_on_commit=False, bind=self._engine,
+                                                                     class_=PinningSession)
+        self._replicas: list[AsyncEngine] = [
+            create_async_engine(replica_url, **(options or engine_options(replica_url))) for replica_url in replica_urls]
+        self._replica_session_makers = [async_sessionmaker(autoflush=False, autocommit=False, expire_on_commit=False,
+                                                           bind=replica) for replica in self._replicas]
+        self._next_replica = itertools.cycle(range(len(self._replicas)))
+        self._unhealthy_until = [0.0] * len(self._replicas)
+        self.cooldown = cooldown
+        self.client = client
+        self.read_your_writes_window = read_your_writes_window
+        self._pinned = LRUCache(read_your_writes_size, read_your_writes_window)
+
+    def pool_status(self) -> dict:
+        """
+        Live statistics of the connection pools
+
+        :return: dict: Pool size, checked out and overflow connections, checkout waits and timeouts of the primary,
+            the same for every replica under replicas
+        """
+        status = self._engine_status(self._engine)
+        if self._replicas:
+            now = time.monotonic()
+            status["replicas"] = [{**self._engine_status(replica), "healthy": until <= now}
+                                  for replica, until in zip(self._replicas, self._unhealthy_until)]
+        return status
+
+    @staticmethod
+    def _engine_status(engine: AsyncEngine) -> dict:
+        pool = engine.pool
+        status = {"pool": pool.__class__.__name__}
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            status.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(),
+                          overflow=pool.overflow())
+        if isinstance(pool, InstrumentedQueuePool):
+            status.update(pool.stats.snapshot())
+        return status
+
+    async def pin(self, key: str):
+        """
+        Send reads with key to the primary for the read-your-writes window, on every worker
+
+        :param key: str: Key of the client, the subject of its access token
+        :return: None
+        """
+        self._pinned.set(key, True)
+        if self.client is None:
+            return
+        try:
+            await self.client.set(f"{self.pin_prefix}{key}", 1,
+                                  px=max(round(self.read_your_writes_window * 1000), 1))
+        except RedisError as err:
+            print(err)
+
+    async def is_pinned(self, key: str | None) -> bool:
+        """
+        Check whether reads with key have to use the primary, also when Redis cannot tell
+
+        :param key: str: Key of the client
+        :return: bool: True within the read-your-writes window after a write of the client
+        """
+        if key is None:
+            return False
+        if self._pinned.get(key) is not None:
+            return True
+        if self.client is None:
+            return False
+        try:
+            return bool(await self.client.exists(f"{self.pin_prefix}{key}"))
+        except RedisError as err:
+            print(err)
+            return True
+
+    async def _replica_session(self) -> AsyncSession | None:
+        now = time.monotonic()
+        for _ in range(len(self._replicas)):
+            index = next(self._next_replica)
+            if self._unhealthy_until[index] > now:
+                continue
+            session = self._replica_session_makers[index]()
+            # responses read from a replica are only cached once the writes of the user have settled
+            session.info["replica"] = True
+            try:
+                await session.connection()
+                return session
+            except (OSError, exc.DBAPIError, exc.TimeoutError) as err:
+                print(err)
+                await session.close()
+                self._unhealthy_until[index] = now + self.cooldown
+        return None
 
     @contextlib.asynccontextmanager
-    async def session(self):
+    async def session(self, key: str | None = None):
+        """
+        Session on the primary, a commit pins reads with key to the primary
+
+        :param key: str: Key of the client for read-your-writes
+        """
         if self._session_maker is None:
             raise Exception("Session is not initialized")
         session = self._session_maker()
+        if key is not None:
+            session.info["pin"] = lambda: self.pin(key)
+        try:
+            yield session
+        except Exception as err:
+            print(err)
+            await session.rollback()
+        finally:
+            await session.close()
+
+    @contextlib.asynccontextmanager
+    async def read_session(self, key: str | None = None):
+        """
+        Session on a healthy replica, or on the primary when there is none or reads with key are pinned
+
+        :param key: str: Key of the client for read-your-writes
+        """
+        session = None
+        if self._replicas and not await self.is_pinned(key):
+            session = await self._replica_session()
+        if session is None:
+            session = self._session_maker()
         try:
             yield session
         except Exception as err:
@@ -25,9 +258,34 @@ class DatabaseSessionManager:
             await session.close()
 
 
-sessionmanager = DatabaseSessionManager(config.DB_URL)
+sessionmanager = DatabaseSessionManager(config.DB_URL, config.DB_REPLICA_URLS, config.DB_REPLICA_COOLDOWN,
+                                        config.DB_READ_YOUR_WRITES_WINDOW, config.DB_READ_YOUR_WRITES_SIZE,
+                                        redis_client)
+
+
+def client_key(request: Request) -> str | None:
+    """
+    Subject of the bearer token of a request, the same for all tokens and devices of a user.
+    The signature is not checked here, the key only decides where reads go, authentication checks the token.
+
+    :param request: Request: Incoming request
+    :return: str | None: Subject or None for requests without a readable token
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        subject = jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        return None
+    return subject if isinstance(subject, str) else None
+
+
+async def get_db(request: Request):
+    async with sessionmanager.session(client_key(request)) as session:
+        yield session
 
 
-async def get_db():
-    async with sessionmanager.session() as session:
+async def get_read_db(request: Request):
+    async with sessionmanager.read_session(client_key(request)) as session:
         yield session
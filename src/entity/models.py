@@ -1,14 +1,24 @@
 from datetime import date
 
-from sqlalchemy.orm import Mapped, mapped_column, DeclarativeBase, relationship
-from sqlalchemy.sql.sqltypes import Date, Integer, Boolean
-from sqlalchemy import String, ForeignKey, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column, DeclarativeBase, relationship, validates
+from sqlalchemy.sql.sqltypes import Date, Integer, Boolean, SmallInteger
+from sqlalchemy import String, ForeignKey, DateTime, Index, func
 
 
 class Base(DeclarativeBase):
     pass
 
 
+def birthday_ordinal(value: date) -> int:
+    """
+    Month and day of a date as one sortable number, e.g. 1231 for Dec 31
+
+    :param value: date: Birthday
+    :return: int: month * 100 + day
+    """
+    return value.month * 100 + value.day
+
+
 class Contact(Base):
     __tablename__ = 'todos'
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -16,12 +26,36 @@ class Contact(Base):
     second_name: Mapped[str] = mapped_column(String(50), index=True)
     email: Mapped[str] = mapped_column(String(50), index=True)
     birthday: Mapped[Date] = mapped_column(Date)
+    birthday_ordinal: Mapped[int] = mapped_column(SmallInteger, nullable=True)
     add_info: Mapped[str] = mapped_column(String(150))
+    external_id: Mapped[str] = mapped_column(String(64), nullable=True)
     created_at: Mapped[date] = mapped_column('created_at', DateTime, default=func.now(), nullable=True)
     updated_at: Mapped[date] = mapped_column('updated_at', DateTime, default=func.now(), onupdate=func.now(),
                                              nullable=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=True)
-    user: Mapped["User"] = relationship("User", backref="todos", lazy="joined")
+    user: Mapped["User"] = relationship("User", backref="todos", lazy="select")
+
+    __table_args__ = (
+        Index('ix_todos_user_id_id', 'user_id', 'id'),
+        Index('ix_todos_user_id_first_name', 'user_id', 'first_name'),
+        Index('ix_todos_user_id_second_name', 'user_id', 'second_name'),
+        Index('ix_todos_user_id_email', 'user_id', 'email'),
+        Index('ix_todos_user_id_birthday_ordinal', 'user_id', 'birthday_ordinal'),
+        Index('ix_todos_user_id_external_id', 'user_id', 'external_id', unique=True),
+        # trigram indexes for fuzzy search, need the pg_trgm and btree_gin extensions
+        Index('ix_todos_user_id_first_name_trgm', 'user_id', 'first_name', postgresql_using='gin',
+              postgresql_ops={'first_name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('ix_todos_user_id_second_name_trgm', 'user_id', 'second_name', postgresql_using='gin',
+              postgresql_ops={'second_name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('ix_todos_user_id_email_trgm', 'user_id', 'email', postgresql_using='gin',
+              postgresql_ops={'email': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
+
+    @validates('birthday')
+    def validate_birthday(self, key, value):
+        if isinstance(value, date):
+            self.birthday_ordinal = birthday_ordinal(value)
+        return value
 
 
 class User(Base):
@@ -37,3 +71,9 @@ class User(Base):
                                              nullable=True)
     confirmed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=True)
 
+
+
+class ContactCount(Base):
+    __tablename__ = 'contact_counts'
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
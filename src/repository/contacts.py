@@ -1,30 +1,127 @@
-from datetime import datetime, timedelta
+import base64
+import heapq
+import json
+import re
+from datetime import date, datetime, timedelta
 
-from sqlalchemy import select, func
+from sqlalchemy import Date, Integer, SmallInteger, String, any_, bindparam, column, delete, insert, select, func, \
+    text, update, values
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import or_
 from sqlalchemy.sql.operators import and_
 
-from src.entity.models import Contact, User
+from src.conf.config import config
+from src.entity.models import Contact, ContactCount, User, birthday_ordinal
 from src.repository import users
 from src.schemas import user
-from src.schemas.contact import ContactSchema, ContactUpdateSchema
+from src.schemas.contact import ContactBatchSchema, ContactSchema, ContactUpdateSchema
+from src.services.response_cache import response_cache
 
 
-async def get_contacts(limit: int, skip: int, db: AsyncSession, current_user: User, offset=None):
+def encode_cursor(contact_id: int) -> str:
     """
-    The get_contacts function returns a list of contacts.
+    The encode_cursor function builds an opaque pagination cursor pointing after a contact.
+
+    :param contact_id: int: Id of the last contact on the page
+    :return: str: Cursor for the next page
+    """
+    return base64.urlsafe_b64encode(json.dumps([contact_id]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    The decode_cursor function reads the contact id from a cursor built by encode_cursor.
+
+    :param cursor: str: Cursor from the client
+    :return: int: Id of the last contact of the previous page
+    :raise ValueError: If the cursor is malformed
+    """
+    try:
+        contact_id, = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (TypeError, ValueError) as err:
+        raise ValueError("Invalid cursor") from err
+    if not isinstance(contact_id, int):
+        raise ValueError("Invalid cursor")
+    return contact_id
+
+
+async def adjust_contact_count(delta: int, db: AsyncSession, current_user: User):
+    """
+    The adjust_contact_count function adds delta to the stored number of contacts of the user.
+    It runs in the transaction of the write that changed the contacts, so the counter commits or rolls back with it.
+
+    :param delta: int: Number of inserted minus number of deleted contacts
+    :param db: AsyncSession: Pass the database session
+    :param current_user: User: Get the current user
+    :return: None
+    """
+    if not delta:
+        return
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(ContactCount).values(user_id=current_user.id, count=delta)
+    stmt = stmt.on_conflict_do_update(index_elements=[ContactCount.user_id],
+                                      set_={"count": ContactCount.count + stmt.excluded.count})
+    await db.execute(stmt)
+
+
+async def get_contact_count(db: AsyncSession, current_user: User) -> int:
+    """
+    The get_contact_count function returns the stored number of contacts of the user with a primary key lookup.
+
+    :param db: AsyncSession: Pass the database session
+    :param current_user: User: Get the current user
+    :return: int: Number of contacts
+    """
+    count = await db.execute(select(ContactCount.count).filter(ContactCount.user_id == current_user.id))
+    return count.scalar_one_or_none() or 0
+
+
+# columns of the read path: the response fields, the id and updated_at, no join to users and no ORM objects
+CONTACT_COLUMNS = (Contact.id, Contact.first_name, Contact.second_name, Contact.email, Contact.birthday,
+                   Contact.add_info, Contact.user_id, Contact.updated_at)
+
+
+async def get_contacts(limit: int, skip: int, db: AsyncSession, current_user: User, after_id: int | None = None):
+    """
+    The get_contacts function returns a list of contacts ordered by (user_id, id).
+    With after_id the page starts right after that contact and seeks on the (user_id, id) index,
+    so every page costs the same as the first one.
 
     :param limit: int: Limit the number of contacts returned
-    :param skip: int: Skip the number of contacts returned
+    :param skip: int: Skip the number of contacts returned, ignored when after_id is given
     :param db: AsyncSession: Pass the database session
     :param current_user: User: Get the current user
-    :param offset: int: Skip the number of contacts returned
-    :return: a list of contacts
+    :param after_id: int: Id of the last contact of the previous page
+    :return: a list of contact rows
     """
-    stmt = select(Contact).filter(Contact.user_id == current_user.id).offset(offset).limit(limit)
+    stmt = select(*CONTACT_COLUMNS).filter(Contact.user_id == current_user.id).order_by(Contact.user_id, Contact.id)
+    if after_id is not None:
+        stmt = stmt.filter(Contact.id > after_id)
+    elif skip:
+        stmt = stmt.offset(skip)
+    stmt = stmt.limit(limit)
     contacts = await db.execute(stmt)
-    return contacts.scalars().all()
+    return contacts.all()
+
+
+async def stream_contacts(columns, db: AsyncSession, current_user: User, batch_size: int = 1000):
+    """
+    The stream_contacts function yields all contacts of the user from a server-side cursor,
+    batch_size rows at a time, so memory does not grow with the number of contacts.
+
+    :param columns: Iterable[str]: Names of the Contact columns to select
+    :param db: AsyncSession: Pass the database session
+    :param current_user: User: Get the current user
+    :param batch_size: int: Number of rows fetched per round trip
+    :return: AsyncIterator[list[Row]]: Partitions of rows
+    """
+    stmt = select(*(getattr(Contact, column) for column in columns)).filter(
+        Contact.user_id == current_user.id).order_by(Contact.user_id, Contact.id).execution_options(
+        yield_per=batch_size)
+    result = await db.stream(stmt)
+    async for partition in result.partitions():
+        yield partition
 
 
 async def get_contact(contact_id: int, db: AsyncSession, current_user: User):
@@ -34,72 +131,239 @@ async def get_contact(contact_id: int, db: AsyncSession, current_user: User):
     :param contact_id: int: Get the contact by id
     :param db: AsyncSession: Pass the database session
     :param current_user: User: Get the current user
-    :return: A contact object
+    :return: A contact row
     """
-    stmt = select(Contact).filter(Contact.user_id == current_user.id).filter_by(id=contact_id)
+    stmt = select(*CONTACT_COLUMNS).filter(Contact.user_id == current_user.id).filter_by(id=contact_id)
     contact = await db.execute(stmt)
-    return contact.scalar_one_or_none()
+    return contact.one_or_none()
+
+
+def contact_from_row(row) -> Contact:
+    """
+    The contact_from_row function builds a transient contact from a row returned by INSERT/UPDATE ... RETURNING,
+    so the caller gets a contact without another SELECT and without attributes expired by the commit.
+
+    :param row: Row: Row with all Contact columns
+    :return: Contact: Contact not attached to any session
+    """
+    return Contact(**row._mapping)
 
 
 async def create_contact(body: ContactSchema, db: AsyncSession, current_user: User):
     """
-    The create_contact function creates a new contact in the database.
+    The create_contact function creates a new contact in the database with one INSERT ... RETURNING.
 
     :param body: ContactSchema: Get the data from the request body
     :param db: AsyncSession: Pass the database session
     :param current_user: User: Get the current user
     :return: A contact object
     """
-    contact = Contact(first_name=body.first_name, second_name=body.second_name, email=body.email,
-                      birthday=body.birthday, add_info=body.add_info, user_id=current_user.id)
-    db.add(contact)
+    stmt = insert(Contact).values(contact_values(body, current_user)).returning(*Contact.__table__.c)
+    result = await db.execute(stmt)
+    contact = contact_from_row(result.one())
+    await adjust_contact_count(1, db, current_user)
     await db.commit()
-    await db.refresh(contact)
+    await response_cache.bump(current_user.id)
     return contact
 
 
+def contact_values(body: ContactSchema, current_user: User) -> dict:
+    """
+    The contact_values function converts a contact body into column values for Core inserts.
+
+    :param body: ContactSchema: Contact data
+    :param current_user: User: Owner of the contact
+    :return: dict: Column values
+    """
+    return {"first_name": body.first_name, "second_name": body.second_name, "email": body.email,
+            "birthday": body.birthday, "birthday_ordinal": birthday_ordinal(body.birthday),
+            "add_info": body.add_info, "user_id": current_user.id}
+
+
+async def import_contacts(batches, db: AsyncSession, current_user: User):
+    """
+    The import_contacts function inserts batches of contacts and adjusts the contact count in one transaction,
+    a failure rolls back every batch. Postgres with asyncpg receives every batch through COPY,
+    other databases through a multi-row INSERT.
+
+    :param batches: AsyncIterator[list[ContactSchema]]: Batches of contacts to insert
+    :param db: AsyncSession: Pass the database session
+    :param current_user: User: Get the current user
+    :return: int: Number of inserted contacts
+    """
+    inserted = 0
+    copy = db.get_bind().dialect.driver == "asyncpg"
+    if copy:
+        # the asyncpg adapter opens its transaction with the first statement it executes, COPY on the raw
+        # connection does not count, without this statement every batch would commit on its own
+        await db.execute(text("SELECT 1"))
+    async for batch in batches:
+        values = [contact_values(body, current_user) for body in batch]
+        if copy:
+            now = datetime.now()
+            connection = await (await db.connection()).get_raw_connection()
+            columns = list(values[0]) + ["created_at", "updated_at"]
+            await connection.driver_connection.copy_records_to_table(
+                Contact.__tablename__, columns=columns, records=[(*row.values(), now, now) for row in values])
+        else:
+            await db.execute(insert(Contact), values)
+        inserted += len(values)
+    await adjust_contact_count(inserted, db, current_user)
+    await db.commit()
+    if inserted:
+        await response_cache.bump(current_user.id)
+    return inserted
+
+
 async def update_contact(contact_id: int, body: ContactUpdateSchema, db: AsyncSession, current_user: User):
     """
-    The update_contact function updates a contact in the database.
+    The update_contact function updates a contact in the database with one UPDATE ... RETURNING.
 
     :param contact_id: int: Get the contact id
     :param body: ContactUpdateSchema: Get the data from the request body
     :param db: AsyncSession: Pass the database session
     :param current_user: User: Get the current user
-    :return: A contact object
+    :return: A contact object or None if the user has no such contact
+    """
+    stmt = update(Contact).where(Contact.user_id == current_user.id, Contact.id == contact_id).values(
+        {field: value for field, value in contact_values(body, current_user).items() if field != "user_id"}
+    ).returning(*Contact.__table__.c)
+    result = await db.execute(stmt, execution_options={"synchronize_session": False})
+    row = result.one_or_none()
+    if row is None:
+        return None
+    await db.commit()
+    await response_cache.bump(current_user.id)
+    return contact_from_row(row)
+
+
+async def delete_contact(contact_id: int, db: AsyncSession, current_user: User):
+    """
+    The delete_contact function deletes a contact from the database with one DELETE ... RETURNING.
+
+    :param contact_id: int: Get the contact id
+    :param db: AsyncSession: Pass the database session
+    :param current_user: User: Get the current user
+    :return: A contact object or None if the user has no such contact
+    """
+    stmt = delete(Contact).where(Contact.user_id == current_user.id, Contact.id == contact_id).returning(
+        *Contact.__table__.c)
+    result = await db.execute(stmt, execution_options={"synchronize_session": False})
+    row = result.one_or_none()
+    if row is None:
+        return None
+    await adjust_contact_count(-1, db, current_user)
+    await db.commit()
+    await response_cache.bump(current_user.id)
+    return contact_from_row(row)
+
+
+BATCH_COLUMNS = (Contact.id, Contact.external_id, Contact.first_name, Contact.second_name, Contact.email,
+                 Contact.birthday, Contact.add_info, Contact.user_id)
+BATCH_FIELDS = ("first_name", "second_name", "email", "birthday", "birthday_ordinal", "add_info")
+
+
+async def batch_update_contacts(items, db: AsyncSession, current_user: User):
+    """
+    The batch_update_contacts function updates contacts by id without reading them first.
+    Postgres applies all items in one UPDATE ... FROM (VALUES ...), other databases run one UPDATE per item.
+    Ids of other users are skipped.
+
+    :param items: list[ContactBatchUpdateSchema]: Contacts with their ids
+    :param db: AsyncSession: Pass the database session
+    :param current_user: User: Get the current user
+    :return: list[Row]: Updated contacts
+    """
+    if not items:
+        return []
+    rows = [{"id": item.id, **contact_values(item, current_user)} for item in items]
+    if db.get_bind().dialect.name == "postgresql":
+        batch = values(column("id", Integer), column("first_name", String), column("second_name", String),
+                       column("email", String), column("birthday", Date), column("birthday_ordinal", SmallInteger),
+                       column("add_info", String), name="batch").data(
+            [tuple(row[field] for field in ("id",) + BATCH_FIELDS) for row in rows])
+        stmt = update(Contact).where(Contact.user_id == current_user.id, Contact.id == batch.c.id).values(
+            {field: batch.c[field] for field in BATCH_FIELDS}).returning(*BATCH_COLUMNS)
+        result = await db.execute(stmt, execution_options={"synchronize_session": False})
+        return result.all()
+    updated = []
+    for row in rows:
+        stmt = update(Contact).where(Contact.user_id == current_user.id, Contact.id == row["id"]).values(
+            {field: row[field] for field in BATCH_FIELDS}).returning(*BATCH_COLUMNS)
+        result = await db.execute(stmt, execution_options={"synchronize_session": False})
+        updated.extend(result.all())
+    return updated
+
+
+async def batch_upsert_contacts(items, db: AsyncSession, current_user: User):
     """
-    stmt = select(Contact).filter(Contact.user_id == current_user.id).filter_by(id=contact_id)
+    The batch_upsert_contacts function inserts contacts or updates the ones with the same external id
+    in one INSERT ... ON CONFLICT (user_id, external_id) DO UPDATE.
+    When an external id repeats in items the last item wins. Only new contacts are added to the contact count.
+
+    :param items: list[ContactUpsertSchema]: Contacts with their external ids
+    :param db: AsyncSession: Pass the database session
+    :param current_user: User: Get the current user
+    :return: list[Row]: Inserted and updated contacts
+    """
+    rows = {item.external_id: {**contact_values(item, current_user), "external_id": item.external_id}
+            for item in items}
+    if not rows:
+        return []
+    existing = await db.execute(select(func.count()).filter(
+        Contact.user_id == current_user.id, Contact.external_id.in_(list(rows))))
+    await adjust_contact_count(len(rows) - existing.scalar_one(), db, current_user)
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(Contact).values(list(rows.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Contact.user_id, Contact.external_id],
+        set_={**{field: stmt.excluded[field] for field in BATCH_FIELDS}, "updated_at": func.now()},
+    ).returning(*BATCH_COLUMNS)
     result = await db.execute(stmt)
-    contact = result.scalar_one_or_none()
-    if contact:
-        contact.first_name = body.first_name
-        contact.second_name = body.second_name
-        contact.email = body.email
-        contact.birthday = body.birthday
-        contact.add_info = body.add_info
+    return result.all()
 
-        await db.commit()
-        await db.refresh(contact)
 
-    return contact
+async def batch_delete_contacts(ids: list[int], db: AsyncSession, current_user: User):
+    """
+    The batch_delete_contacts function deletes contacts by id in one DELETE.
+    Postgres receives the ids as a single array parameter.
 
+    :param ids: list[int]: Ids of the contacts
+    :param db: AsyncSession: Pass the database session
+    :param current_user: User: Get the current user
+    :return: list[int]: Ids of the deleted contacts
+    """
+    if not ids:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        condition = Contact.id == any_(bindparam("ids", ids, type_=postgresql.ARRAY(Integer)))
+    else:
+        condition = Contact.id.in_(ids)
+    stmt = delete(Contact).where(Contact.user_id == current_user.id, condition).returning(Contact.id)
+    result = await db.execute(stmt, execution_options={"synchronize_session": False})
+    deleted = list(result.scalars())
+    await adjust_contact_count(-len(deleted), db, current_user)
+    return deleted
 
-async def delete_contact(contact_id: int, db: AsyncSession, current_user: User):
+
+async def batch_contacts(body: ContactBatchSchema, db: AsyncSession, current_user: User):
     """
-    The delete_contact function deletes a contact from the database.
+    The batch_contacts function applies updates, upserts and deletes of many contacts in one transaction.
 
-    :param contact_id: int: Get the contact id
+    :param body: ContactBatchSchema: Contacts to update by id, to upsert by external id and ids to delete
     :param db: AsyncSession: Pass the database session
     :param current_user: User: Get the current user
-    :return: A contact object
+    :return: dict: Updated and upserted contacts and ids of the deleted ones
     """
-    stmt = select(Contact).filter(Contact.user_id == current_user.id).filter_by(id=contact_id)
-    contact = await db.execute(stmt)
-    contact = contact.scalar_one_or_none()
-    if contact:
-        await db.delete(contact)
-        await db.commit()
-    return contact
+    result = {
+        "updated": await batch_update_contacts(body.update, db, current_user),
+        "upserted": await batch_upsert_contacts(body.upsert, db, current_user),
+        "deleted": await batch_delete_contacts(body.delete, db, current_user),
+    }
+    await db.commit()
+    if any(result.values()):
+        await response_cache.bump(current_user.id)
+    return result
 
 
 async def search_contacts(first_name: str, second_name: str, email: str, db: AsyncSession, current_user: User):
@@ -111,9 +375,9 @@ async def search_contacts(first_name: str, second_name: str, email: str, db: Asy
     :param email: str: Search for contacts by email
     :param db: AsyncSession: Pass the database session
     :param current_user: User: Get the current user
-    :return: A list of contacts
+    :return: A list of contact rows
     """
-    stmt = select(Contact).filter(Contact.user_id == current_user.id)
+    stmt = select(*CONTACT_COLUMNS).filter(Contact.user_id == current_user.id)
 
     if first_name:
         stmt = stmt.filter(Contact.first_name == first_name)
@@ -123,26 +387,133 @@ async def search_contacts(first_name: str, second_name: str, email: str, db: Asy
         stmt = stmt.filter(Contact.email == email)
 
     contacts = await db.execute(stmt)
-    return contacts.scalars().all()
+    return contacts.all()
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    The trigrams function splits text into trigrams the same way pg_trgm does:
+    lower case alphanumeric words padded with two spaces in front and one behind.
 
+    :param text: str: Text to split
+    :return: set[str]: Trigrams of the text
+    """
+    result = set()
+    for word in re.findall(r"[^\W_]+", text.lower()):
+        word = f"  {word} "
+        result.update(word[i:i + 3] for i in range(len(word) - 2))
+    return result
+
+
+def trigram_similarity(left: str, right: str) -> float:
+    """
+    The trigram_similarity function is a Python port of pg_trgm similarity() used when the database has no pg_trgm.
 
-async def get_contacts_birthday(db: AsyncSession, current_user: User):
+    :param left: str: First text
+    :param right: str: Second text
+    :return: float: Shared trigrams divided by all trigrams of both texts, from 0 to 1
     """
-    The get_contacts_birthday function returns a list of contacts who have their birthday today.
+    left, right = trigrams(left), trigrams(right)
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
 
+
+async def fuzzy_search_contacts(query: str, limit: int, db: AsyncSession, current_user: User):
+    """
+    The fuzzy_search_contacts function returns the contacts most similar to query by first name, second name or email,
+    best match first. On Postgres the pg_trgm % operator is served by the (user_id, column) GIN trigram indexes,
+    other databases fall back to ranking the user's contacts in Python.
+
+    :param query: str: Text to search for
+    :param limit: int: Maximum number of contacts returned
     :param db: AsyncSession: Pass the database session
     :param current_user: User: Get the current user
-    :return: A list of contacts
+    :return: A list of contact rows
+    """
+    threshold = config.SEARCH_SIMILARITY_THRESHOLD
+    if db.get_bind().dialect.name == "postgresql":
+        await db.execute(select(func.set_config("pg_trgm.similarity_threshold", str(threshold), True)))
+        score = func.greatest(func.similarity(Contact.first_name, query), func.similarity(Contact.second_name, query),
+                              func.similarity(Contact.email, query))
+        stmt = select(*CONTACT_COLUMNS).filter(Contact.user_id == current_user.id).filter(
+            or_(Contact.first_name.op("%")(query), Contact.second_name.op("%")(query), Contact.email.op("%")(query))
+        ).order_by(score.desc(), Contact.id).limit(limit)
+        contacts = await db.execute(stmt)
+        return contacts.all()
+
+    stmt = select(*CONTACT_COLUMNS).filter(Contact.user_id == current_user.id)
+    contacts = await db.execute(stmt)
+    scored = []
+    for contact in contacts:
+        score = max(trigram_similarity(contact.first_name, query), trigram_similarity(contact.second_name, query),
+                    trigram_similarity(contact.email, query))
+        if score >= threshold:
+            scored.append((score, -contact.id, contact))
+    return [contact for _, _, contact in heapq.nlargest(limit, scored, key=lambda item: item[:2])]
+
+
+def birthday_window(start: date, days: int):
+    """
+    The birthday_window function builds the filter for birthdays from start to start + days inclusive.
+    The filter is a range on Contact.birthday_ordinal, split in two ranges when the window crosses Dec 31.
+
+    :param start: date: First day of the window
+    :param days: int: Length of the window in days
+    :return: A filter clause or None if the window covers the whole year
     """
-    today = datetime.today()
-    week_from_now = today + timedelta(days=7)
+    if days >= 365:
+        return None
+    first = birthday_ordinal(start)
+    last = birthday_ordinal(start + timedelta(days=days))
+    if first <= last:
+        return Contact.birthday_ordinal.between(first, last)
+    return or_(Contact.birthday_ordinal >= first, Contact.birthday_ordinal <= last)
+
 
-    stmt = select(Contact).filter(Contact.user_id == current_user.id).filter(
-        func.date_part('month', Contact.birthday) == today.month,
-        func.date_part('day', Contact.birthday) >= today.day,
-        func.date_part('day', Contact.birthday) <= week_from_now.day,
+async def get_contacts_birthday(db: AsyncSession, current_user: User, days: int = 7):
+    """
+    The get_contacts_birthday function returns a list of contacts who have their birthday in the next days,
+    ordered by the upcoming date. The window may cross a month or a year end.
 
-    )
+    :param db: AsyncSession: Pass the database session
+    :param current_user: User: Get the current user
+    :param days: int: Number of days to look ahead, today included
+    :return: A list of contact rows
+    """
+    today = date.today()
+    first = birthday_ordinal(today)
+
+    stmt = select(*CONTACT_COLUMNS).filter(Contact.user_id == current_user.id)
+    window = birthday_window(today, days)
+    if window is not None:
+        stmt = stmt.filter(window)
+    stmt = stmt.order_by(Contact.birthday_ordinal < first, Contact.birthday_ordinal)
 
     contacts = await db.execute(stmt)
-    return contacts.scalars().all()
+    return contacts.all()
+
+
+async def stream_upcoming_birthdays(start: date, days: int, db: AsyncSession, batch_size: int = 1000):
+    """
+    The stream_upcoming_birthdays function yields the contacts of all confirmed users with a birthday
+    from start to start + days in one query, ordered by user and by upcoming date,
+    so a consumer can build one digest per user while the rows stream in.
+
+    :param start: date: First day of the window
+    :param days: int: Length of the window in days
+    :param db: AsyncSession: Pass the database session
+    :param batch_size: int: Number of rows fetched per round trip
+    :return: AsyncIterator[list[Row]]: Partitions of rows with the user and the contact columns
+    """
+    first = birthday_ordinal(start)
+    stmt = select(User.id.label("user_id"), User.email, User.username, Contact.first_name, Contact.second_name,
+                  Contact.birthday).join(Contact, Contact.user_id == User.id).filter(User.confirmed.is_(True))
+    window = birthday_window(start, days)
+    if window is not None:
+        stmt = stmt.filter(window)
+    stmt = stmt.order_by(Contact.user_id, Contact.birthday_ordinal < first, Contact.birthday_ordinal).execution_options(
+        yield_per=batch_size)
+    result = await db.stream(stmt)
+    async for partition in result.partitions():
+        yield partition
@@ -1,11 +1,13 @@
 from fastapi import Depends
-from sqlalchemy import select
+from sqlalchemy import insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 from libgravatar import Gravatar
 
 from src.database.db import get_db
 from src.entity.models import User
 from src.schemas.user import UserSchema
+from src.services.cache import user_cache
 
 
 async def get_user_by_email(email: str, db: AsyncSession = Depends(get_db)):
@@ -21,9 +23,19 @@ async def get_user_by_email(email: str, db: AsyncSession = Depends(get_db)):
     return user
 
 
+def user_from_row(row) -> User:
+    """
+    The user_from_row function builds a transient user from a row returned by INSERT/UPDATE ... RETURNING.
+
+    :param row: Row: Row with all User columns
+    :return: User: User not attached to any session
+    """
+    return User(**row._mapping)
+
+
 async def create_user(body: UserSchema, db: AsyncSession = Depends(get_db)):
     """
-    The create_user function creates a new user in the database.
+    The create_user function creates a new user in the database with one INSERT ... RETURNING.
 
     :param body: UserSchema: Get the data from the request body
     :param db: AsyncSession: Pass the database session to the function
@@ -36,10 +48,10 @@ async def create_user(body: UserSchema, db: AsyncSession = Depends(get_db)):
     except Exception as err:
         print(err)
 
-    new_user = User(**body.model_dump(), avatar=avatar)
-    db.add(new_user)
+    stmt = insert(User).values(**body.model_dump(), avatar=avatar).returning(*User.__table__.c)
+    result = await db.execute(stmt)
+    new_user = user_from_row(result.one())
     await db.commit()
-    await db.refresh(new_user)
     return new_user
 
 
@@ -52,8 +64,27 @@ async def update_token(user: User, token: str | None, db: AsyncSession):
     :param db: AsyncSession: Pass the database session to the function
     :return: A user object
     """
-    user.refresh_token = token
+    await db.execute(update(User).where(User.id == user.id).values(refresh_token=token),
+                     execution_options={"synchronize_session": False})
+    await db.commit()
+    set_committed_value(user, "refresh_token", token)
+    await user_cache.invalidate(user.email)
+
+
+async def update_password(user: User, password: str, db: AsyncSession):
+    """
+    The update_password function replaces the password hash of a user, e.g. after a bcrypt cost change.
+
+    :param user: User: Get the user object
+    :param password: str: New password hash
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    await db.execute(update(User).where(User.id == user.id).values(password=password),
+                     execution_options={"synchronize_session": False})
     await db.commit()
+    set_committed_value(user, "password", password)
+    await user_cache.invalidate(user.email)
 
 
 async def confirmed_email(email: str, db: AsyncSession) -> None:
@@ -64,22 +95,24 @@ async def confirmed_email(email: str, db: AsyncSession) -> None:
     :param db: AsyncSession: Pass the database session to the function
     :return: None
     """
-    user = await get_user_by_email(email, db)
-    user.confirmed = True
+    await db.execute(update(User).where(User.email == email).values(confirmed=True),
+                     execution_options={"synchronize_session": False})
     await db.commit()
+    await user_cache.invalidate(email)
 
 
 async def update_avatar_url(email: str, url: str | None, db: AsyncSession):
     """
-    The update_avatar_url function updates the avatar URL of a user.
+    The update_avatar_url function updates the avatar URL of a user with one UPDATE ... RETURNING.
 
     :param email: str: Get the email of the user
     :param url: str: Update the avatar URL
     :param db: AsyncSession: Pass the database session to the function
     :return: A user object
     """
-    user = await get_user_by_email(email, db)
-    user.avatar = url
+    stmt = update(User).where(User.email == email).values(avatar=url).returning(*User.__table__.c)
+    result = await db.execute(stmt, execution_options={"synchronize_session": False})
+    user = user_from_row(result.one())
     await db.commit()
-    await db.refresh(user)
+    await user_cache.invalidate(email)
     return user
@@ -8,12 +8,24 @@ from src.database.db import get_db
 from src.repository import users as repositories_users
 from src.schemas.user import UserSchema, TokenSchema, UserResponse, RequestEmail
 from src.services.auth import auth_service
+from src.services.passwords import PasswordPoolBusy
+from src.services.tokens import InvalidRefreshToken, TokenStoreUnavailable
 from src.services.email import send_email
 
 router = APIRouter(prefix='/auth', tags=['auth'])
 get_refresh_token = HTTPBearer()
 
 
+def password_service_busy():
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=PASSWORD_SERVICE_BUSY,
+                         headers={"Retry-After": "1"})
+
+
+def token_service_unavailable():
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=TOKEN_SERVICE_UNAVAILABLE,
+                         headers={"Retry-After": "5"})
+
+
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def signup(body: UserSchema, bt: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
     """
@@ -28,7 +40,10 @@ async def signup(body: UserSchema, bt: BackgroundTasks, request: Request, db: As
     exist_user = await repositories_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=ACCOUNT_EXISTS)
-    body.password = auth_service.get_password_hash(body.password)
+    try:
+        body.password = await auth_service.get_password_hash_async(body.password)
+    except PasswordPoolBusy:
+        raise password_service_busy()
     new_user = await repositories_users.create_user(body, db)
     bt.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
     return new_user
@@ -48,33 +63,42 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession =
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=INVALID_EMAIL)
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=EMAIL_NOT_CONFIRMED)
-    if not auth_service.verify_password(body.password, user.password):
+    try:
+        valid_password, new_hash = await auth_service.verify_and_update_password(body.password, user.password)
+    except PasswordPoolBusy:
+        raise password_service_busy()
+    if not valid_password:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=INVALID_PASSWORD)
+    if new_hash is not None:
+        await repositories_users.update_password(user, new_hash, db)
     access_token = await auth_service.create_access_token(data={"sub": user.email, "test": "test"})
-    refresh_token2 = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repositories_users.update_token(user, refresh_token2, db)
+    try:
+        family, jti = await auth_service.refresh_tokens.start()
+    except TokenStoreUnavailable:
+        raise token_service_unavailable()
+    refresh_token2 = await auth_service.create_refresh_token(data={"sub": user.email, "fam": family, "jti": jti})
     return {"access_token": access_token, "refresh_token": refresh_token2, "token_type": "bearer"}
 
 
 @router.get('/refresh_token')
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(get_refresh_token),
-                        db: AsyncSession = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(get_refresh_token)):
     """
-    Refresh token for user and return access and refresh token for user
+    Rotate refresh token and return new access and refresh token for user.
+    Reusing an already rotated refresh token revokes every token issued since the login.
 
     :param credentials: HTTPAuthorizationCredentials: Credentials with refresh token
-    :param db: AsyncSession: AsyncSession for database connection
     :return: TokenSchema: Access and refresh token
     """
-    token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repositories_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repositories_users.update_token(user, None, db)
+    payload = await auth_service.decode_refresh_token_payload(credentials.credentials)
+    email = payload["sub"]
+    try:
+        jti = await auth_service.refresh_tokens.rotate(payload.get("fam", ""), payload.get("jti", ""))
+    except InvalidRefreshToken:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    except TokenStoreUnavailable:
+        raise token_service_unavailable()
     access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token3 = await auth_service.create_refresh_token(data={"sub": email})
-    await repositories_users.update_token(user, refresh_token3, db)
+    refresh_token3 = await auth_service.create_refresh_token(data={"sub": email, "fam": payload["fam"], "jti": jti})
     return {"access_token": access_token, "refresh_token": refresh_token3, "token_type": "bearer"}
 
 
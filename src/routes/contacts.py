@@ -1,48 +1,137 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Path, Query
-from fastapi_limiter.depends import RateLimiter
+from datetime import date
+
+from fastapi import APIRouter, HTTPException, Depends, status, Path, Query, Request, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.conf.config import config
+from src.conf.messages import INVALID_CURSOR, UNSUPPORTED_IMPORT_FORMAT
+from src.database.db import get_db, get_read_db
 from src.entity.models import User
 from src.repository import contacts as repositories_contacts
-from src.schemas.contact import ContactSchema, ContactUpdateSchema, ContactResponse
+from src.schemas.contact import ContactSchema, ContactUpdateSchema, ContactResponse, ImportReportSchema, \
+    ContactBatchSchema, ContactBatchResponse, ContactRowResponse, ContactBirthdayResponse
 from src.services.auth import auth_service
+from src.services.conditional import etag_matches, is_not_modified, last_modified, make_etag, version_etag
+from src.services.exports import EXPORT_FIELDS, EXPORT_MEDIA_TYPES, export_chunks
+from src.services.imports import ContactImport, detect_format
+from src.services.rate_limit import rate_limit
+from src.services.response_cache import response_cache
+from src.services.serializers import Renderer
+
+rate_limits = [Depends(rate_limit(config.CONTACTS_RATE_LIMIT_TIMES, config.CONTACTS_RATE_LIMIT_SECONDS,
+                                  scope="contacts"))] if config.CONTACTS_RATE_LIMIT_TIMES else []
+router = APIRouter(prefix='/contacts', tags=['contacts'], dependencies=rate_limits)
+
+contact_list_renderer = Renderer(ContactResponse, many=True)
+contact_renderer = Renderer(ContactResponse)
+contact_row_list_renderer = Renderer(ContactRowResponse, many=True)
+birthday_renderer = Renderer(ContactRowResponse, key="contacts")
+
+
+async def cached_response(request: Request, route: str, params: dict, db: AsyncSession, current_user: User,
+                          renderer: Renderer, load):
+    """
+    Serve a response of the current user from the response cache, or load, render and cache it.
+    The ETag is derived from the cache key, i.e. the generation of the user, the route and the parameters,
+    so a matching If-None-Match gets 304 before the cache or the database is asked. Without a generation,
+    before the first write of the user or with Redis down, the ETag is a hash of the body and a match needs
+    the body. Responses read from a replica shortly after a write of the user, which the replica may still
+    miss, are not cached and get the body hash as well.
 
-router = APIRouter(prefix='/contacts', tags=['contacts'])
+    :param request: Request: Request with the conditional headers
+    :param route: str: Name of the route
+    :param params: dict: Parameters that change the response
+    :param db: AsyncSession: Session load reads from
+    :param current_user: User: Current user
+    :param renderer: Renderer: Response model used to render the loaded content, FAST_RESPONSES skips validation
+    :param load: Coroutine function returning the content and its headers, content None is not cached
+    :return: Response | None: JSON or 304 response, None if load found nothing
+    """
+    generation = await response_cache.generation(current_user.id)
+    key = await response_cache.key(current_user.id, route, params, generation)
+    # the generation changes with every write of the user, the fields with the response model
+    etag = version_etag(key, *renderer.fields) if generation > 0 else None
+    if etag is not None and etag_matches(request.headers, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    entry = await response_cache.get(key, route)
+    if entry is None:
+        content, headers = await load()
+        if content is None:
+            return None
+        body = renderer.render(content, config.FAST_RESPONSES)
+        current = not db.info.get("replica") or await response_cache.settled(current_user.id)
+        entry = body, {**headers, "ETag": etag if etag is not None and current else make_etag(body)}
+        if current:
+            await response_cache.set(key, *entry)
+    body, headers = entry
+    if is_not_modified(request.headers, headers.get("ETag"), headers.get("Last-Modified")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @router.get('/', response_model=list[ContactResponse])
-async def get_contacts(limit: int = Query(10, ge=10, le=500),
-                       offset: int = Query(0, ge=0), db: AsyncSession = Depends(get_db),
+async def get_contacts(request: Request, limit: int = Query(10, ge=10, le=500),
+                       offset: int = Query(0, ge=0),
+                       cursor: str = Query(None, description='Cursor from the X-Next-Cursor header'),
+                       db: AsyncSession = Depends(get_read_db),
                        current_user: User = Depends(auth_service.get_current_user)):
     """
-    Get list of contacts with pagination and filtering by limit and offset parameters
+    Get list of contacts with pagination by limit and offset or by cursor.
+    A full page sets the X-Next-Cursor header, pass it back as cursor to get the next page.
+    X-Total-Count holds the number of all contacts of the user.
+    ETag allows conditional requests with If-None-Match. The page has no Last-Modified, the newest updated_at
+    of its rows does not change when a contact is deleted or the page shifts.
+
+    :param request: Request: Request with the conditional headers
     :param limit: int: Limit of contacts
-    :param offset: int: Offset of contacts
+    :param offset: int: Offset of contacts, ignored when cursor is given
+    :param cursor: str: Cursor of the next page
     :param db: AsyncSession: AsyncSession for database connection
     :param current_user: User: Current user
     :return: list[ContactResponse]: List of contacts
     """
-    contacts = await repositories_contacts.get_contacts(limit, offset, db, current_user)
-    return contacts
+    after_id = None
+    if cursor:
+        try:
+            after_id = repositories_contacts.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=INVALID_CURSOR)
+
+    async def load():
+        contacts = await repositories_contacts.get_contacts(limit, offset, db, current_user, after_id)
+        headers = {"X-Total-Count": str(await repositories_contacts.get_contact_count(db, current_user))}
+        if len(contacts) == limit:
+            headers["X-Next-Cursor"] = repositories_contacts.encode_cursor(contacts[-1].id)
+        return contacts, headers
+
+    params = {"limit": limit, "offset": offset, "after_id": after_id}
+    return await cached_response(request, "get_contacts", params, db, current_user, contact_list_renderer, load)
 
 
 @router.get('/{contact_id}', response_model=ContactResponse)
-async def get_contact(contact_id: int, db: AsyncSession = Depends(get_db),
+async def get_contact(request: Request, contact_id: int, db: AsyncSession = Depends(get_read_db),
                       current_user: User = Depends(auth_service.get_current_user)):
     """
-    Get contact by id
+    Get contact by id, with ETag and Last-Modified for conditional requests
 
+    :param request: Request: Request with the conditional headers
     :param contact_id: int: Id of contact
     :param db: AsyncSession: AsyncSession for database connection
     :param current_user: User: Current user
     :return: ContactResponse: Contact
     """
-    contact = await repositories_contacts.get_contact(contact_id, db, current_user)
-    if contact is None:
+    async def load():
+        contact = await repositories_contacts.get_contact(contact_id, db, current_user)
+        modified = last_modified([contact]) if contact is not None else None
+        return contact, {"Last-Modified": modified} if modified else {}
+
+    response = await cached_response(request, "get_contact", {"contact_id": contact_id}, db, current_user,
+                                     contact_renderer, load)
+    if response is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='NOT Found contact')
-    return contact
+    return response
 
 
 @router.post('/', response_model=ContactResponse, status_code=201)
@@ -60,6 +149,46 @@ async def create_contact(body: ContactSchema, db: AsyncSession = Depends(get_db)
     return contact
 
 
+@router.post('/import', response_model=ImportReportSchema)
+async def import_contacts(file: UploadFile = File(),
+                          format: str = Query(None, pattern='^(csv|ndjson)$',
+                                              description='csv or ndjson, guessed from the file when omitted'),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Import contacts from a CSV file with a header line or from NDJSON with one contact per line.
+    Rows are validated and inserted in batches, invalid rows are skipped and listed in the report.
+
+    :param file: UploadFile: CSV or NDJSON file
+    :param format: str: Format of the file
+    :param db: AsyncSession: AsyncSession for database connection
+    :param current_user: User: Current user
+    :return: ImportReportSchema: Number of inserted and failed rows and the errors per row
+    """
+    fmt = format or detect_format(file.filename, file.content_type)
+    if fmt is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=UNSUPPORTED_IMPORT_FORMAT)
+    contact_import = ContactImport(file.file, fmt, current_user.id, config.IMPORT_BATCH_SIZE,
+                                   config.IMPORT_MAX_ERRORS)
+    inserted = await repositories_contacts.import_contacts(contact_import.batches(), db, current_user)
+    return contact_import.report(inserted)
+
+
+@router.post('/batch/', response_model=ContactBatchResponse)
+async def batch_contacts(body: ContactBatchSchema, db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Update contacts by id, upsert contacts by external_id and delete contacts by id in one transaction.
+    Ids of contacts that do not belong to the current user are skipped.
+
+    :param body: ContactBatchSchema: Up to 1000 updates, upserts and deletes
+    :param db: AsyncSession: AsyncSession for database connection
+    :param current_user: User: Current user
+    :return: ContactBatchResponse: Updated and upserted contacts and ids of deleted contacts
+    """
+    return await repositories_contacts.batch_contacts(body, db, current_user)
+
+
 @router.put('/{contact_id}')
 async def update_contact(body: ContactUpdateSchema, contact_id: int = Path(ge=1),
                          db: AsyncSession = Depends(get_db),
@@ -94,39 +223,75 @@ async def delete_contact(contact_id: int, db: AsyncSession = Depends(get_db),
     return contact
 
 
-@router.get('/search/')
+@router.get('/search/', response_model=list[ContactRowResponse])
 async def search(
+        request: Request,
         first_name: str = Query(None, description='Search by first_name'),
         second_name: str = Query(None, description='Search by second_name'),
         email: str = Query(None, description='Search by email'),
-        db: AsyncSession = Depends(get_db),
+        q: str = Query(None, min_length=1, max_length=150,
+                       description='Fuzzy search by first_name, second_name or email, best match first'),
+        limit: int = Query(10, ge=1, le=100, description='Maximum number of fuzzy search results'),
+        db: AsyncSession = Depends(get_read_db),
         current_user: User = Depends(auth_service.get_current_user)
 ):
     """
-    Search contacts by first_name, second_name and email
+    Search contacts by first_name, second_name and email.
+    With q the search is fuzzy and returns the limit most similar contacts instead.
 
+    :param request: Request: Request with the conditional headers
     :param first_name: str: Search by first_name
     :param second_name: str: Search by second_name
     :param email: str: Search by email
+    :param q: str: Fuzzy search text
+    :param limit: int: Maximum number of fuzzy search results
     :param db: AsyncSession: AsyncSession for database connection
     :param current_user: User: Current user
-    :return: list[ContactResponse]: List of contacts
+    :return: list[ContactRowResponse]: List of contacts
     """
-    contacts = await repositories_contacts.search_contacts(first_name, second_name, email, db, current_user)
-    if contacts is [None]:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='NOT Found contact')
-    return contacts
+    async def load():
+        if q:
+            return await repositories_contacts.fuzzy_search_contacts(q, limit, db, current_user), {}
+        return await repositories_contacts.search_contacts(first_name, second_name, email, db, current_user), {}
+
+    params = {"first_name": first_name, "second_name": second_name, "email": email, "q": q, "limit": limit}
+    return await cached_response(request, "search", params, db, current_user, contact_row_list_renderer, load)
+
+
+@router.get('/export/', response_class=StreamingResponse,
+            responses={200: {"content": {media_type: {} for media_type in EXPORT_MEDIA_TYPES.values()}}})
+async def export_contacts(format: str = Query('ndjson', pattern='^(csv|ndjson)$', description='csv or ndjson'),
+                          db: AsyncSession = Depends(get_read_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Export all contacts of the current user as NDJSON or CSV.
+    Rows are streamed from a server-side cursor, memory use does not depend on the number of contacts.
+
+    :param format: str: Format of the export
+    :param db: AsyncSession: AsyncSession for database connection, stays open until the stream ends
+    :param current_user: User: Current user
+    :return: StreamingResponse: Contacts
+    """
+    partitions = repositories_contacts.stream_contacts(EXPORT_FIELDS, db, current_user, config.EXPORT_BATCH_SIZE)
+    return StreamingResponse(export_chunks(partitions, format), media_type=EXPORT_MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="contacts.{format}"'})
 
 
-@router.get('/birthday/')
-async def get_birthday(db: AsyncSession = Depends(get_db),
+@router.get('/birthday/', response_model=ContactBirthdayResponse)
+async def get_birthday(request: Request, days: int = Query(7, ge=1, le=366, description='Number of days to look ahead'),
+                       db: AsyncSession = Depends(get_read_db),
                        current_user: User = Depends(auth_service.get_current_user)):
     """
-    Get contacts with birthday in current month
+    Get contacts with birthday in the next days
 
+    :param request: Request: Request with the conditional headers
+    :param days: int: Number of days to look ahead
     :param db: AsyncSession: AsyncSession for database connection
     :param current_user: User: Current user
-    :return: list[ContactResponse]: List of contacts
+    :return: ContactBirthdayResponse: List of contacts
     """
-    contacts = await repositories_contacts.get_contacts_birthday(db, current_user)
-    return {"contacts": contacts}
+    async def load():
+        return {"contacts": await repositories_contacts.get_contacts_birthday(db, current_user, days)}, {}
+
+    params = {"days": days, "today": date.today()}
+    return await cached_response(request, "birthday", params, db, current_user, birthday_renderer, load)
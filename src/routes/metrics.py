@@ -0,0 +1,54 @@
+import secrets
+
+from fastapi import APIRouter, Depends, HTTPException, Security, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from src.conf import messages
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.services.auth import auth_service
+from src.services.avatars import avatar_pipeline
+from src.services.mailer import mailer
+from src.services.rate_limit import rate_limiter
+from src.services.response_cache import response_cache
+
+get_metrics_token = HTTPBearer(auto_error=False)
+
+
+async def verify_metrics_token(credentials: HTTPAuthorizationCredentials | None = Security(get_metrics_token)):
+    """
+    Let only clients with the METRICS_TOKEN bearer token read the metrics, without a configured token
+    the metrics are not served at all
+
+    :param credentials: HTTPAuthorizationCredentials: Bearer token of the request
+    :return: None
+    """
+    if not config.METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if credentials is None or not secrets.compare_digest(credentials.credentials.encode(),
+                                                          config.METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_METRICS_TOKEN,
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+router = APIRouter(prefix='/metrics', tags=['metrics'], dependencies=[Depends(verify_metrics_token)],
+                   include_in_schema=False)
+
+
+@router.get('/')
+async def get_metrics():
+    """
+    Get in-process counters of this worker, only with the METRICS_TOKEN bearer token
+
+    :return: dict: Statistics of the token, user and response caches, of the database pool, of the mailer,
+        of the avatar pipeline and of the local rate limiter
+    """
+    return {
+        "db_pool": sessionmanager.pool_status(),
+        "token_cache": auth_service.token_cache.stats(),
+        "user_cache": auth_service.cache.local.stats(),
+        "response_cache": response_cache.stats(),
+        "mailer": mailer.stats(),
+        "avatars": avatar_pipeline.stats(),
+        "rate_limiter": rate_limiter.stats(),
+    }
@@ -22,3 +22,46 @@ class ContactResponse(ContactSchema):
     birthday: PastDate
     add_info: str
     model_config = ConfigDict(from_attributes=True) # noqa
+
+
+class ContactRowResponse(ContactResponse):
+    id: int
+
+
+class ContactBirthdayResponse(BaseModel):
+    contacts: list[ContactRowResponse]
+
+
+class ImportErrorSchema(BaseModel):
+    row: int
+    errors: list[str]
+
+
+class ImportReportSchema(BaseModel):
+    inserted: int
+    failed: int
+    errors: list[ImportErrorSchema]
+
+
+class ContactBatchUpdateSchema(ContactSchema):
+    id: int
+
+
+class ContactUpsertSchema(ContactSchema):
+    external_id: str = Field(min_length=1, max_length=64)
+
+
+class ContactBatchSchema(BaseModel):
+    update: list[ContactBatchUpdateSchema] = Field(default=[], max_length=1000)
+    upsert: list[ContactUpsertSchema] = Field(default=[], max_length=1000)
+    delete: list[int] = Field(default=[], max_length=1000)
+
+
+class ContactBatchRow(ContactRowResponse):
+    external_id: str | None = None
+
+
+class ContactBatchResponse(BaseModel):
+    updated: list[ContactBatchRow]
+    upserted: list[ContactBatchRow]
+    deleted: list[int]
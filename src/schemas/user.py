@@ -12,6 +12,7 @@ class UserResponse(UserSchema):
     id: int = 1
     username: str
     email: str
+    avatar: str | None = None
     model_config = ConfigDict(from_attributes=True)  # noqa
 
 
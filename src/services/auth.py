@@ -1,10 +1,9 @@
-import pickle
+import hashlib
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
-import redis
 from fastapi import Depends, HTTPException, status
-from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
@@ -12,6 +11,9 @@ from jose import JWTError, jwt
 from src.database.db import get_db
 from src.repository import users as repository_users
 from src.conf.config import config
+from src.services.cache import LRUCache, user_cache
+from src.services.passwords import password_hasher, pwd_context
+from src.services.tokens import refresh_token_store
 
 
 class Auth:
@@ -21,7 +23,10 @@ class Auth:
     :param pwd_context: CryptContext: CryptContext for password hashing
     :param SECRET_KEY: str: Secret key for JWT
     :param ALGORITHM: str: Algorithm for JWT
-    :param cache: redis.Redis: Redis for caching
+    :param password_hasher: PasswordHasher: Bounded worker pool for bcrypt
+    :param cache: UserCache: Two-tier user cache (in-process LRU in front of Redis)
+    :param refresh_tokens: RedisRefreshTokenStore: Rotating refresh token families
+    :param token_cache: LRUCache: Subjects of verified access tokens keyed by token digest
     :param oauth2_scheme: OAuth2PasswordBearer: OAuth2PasswordBearer for authentication
     :param verify_password: verify_password: Function for password verification
     :param get_password_hash: get_password_hash: Function for password hashing
@@ -46,10 +51,13 @@ class Auth:
     :param get_current_superuser: get_current_superuser: Function for getting current superuser
     :param get_user_by_id: get_user_by_id: Function for getting user by id
     """
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = pwd_context
+    password_hasher = password_hasher
     SECRET_KEY = config.SECRET_KEY_JWT
     ALGORITHM = config.ALGORITHM
-    cache = redis.Redis(host=config.REDIS_DOMAIN, port=config.REDIS_PORT, password=config.REDIS_PASSWORD, db=0)
+    cache = user_cache
+    refresh_tokens = refresh_token_store
+    token_cache = LRUCache(config.TOKEN_CACHE_SIZE, config.TOKEN_CACHE_TTL)
 
     def verify_password(self, plain_password, hashed_password):
         return self.pwd_context.verify(plain_password, hashed_password)
@@ -57,6 +65,15 @@ class Auth:
     def get_password_hash(self, password: str):
         return self.pwd_context.hash(password)
 
+    async def verify_password_async(self, plain_password, hashed_password):
+        return await self.password_hasher.verify(plain_password, hashed_password)
+
+    async def verify_and_update_password(self, plain_password, hashed_password):
+        return await self.password_hasher.verify_and_update(plain_password, hashed_password)
+
+    async def get_password_hash_async(self, password: str):
+        return await self.password_hasher.hash(password)
+
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
     # define a function to generate a new access token
@@ -76,17 +93,20 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(seconds=config.REFRESH_TOKEN_TTL)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
         encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
 
     async def decode_refresh_token(self, refresh_token: str):
+        payload = await self.decode_refresh_token_payload(refresh_token)
+        return payload['sub']
+
+    async def decode_refresh_token_payload(self, refresh_token: str):
         try:
             payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
+                return payload
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
@@ -98,31 +118,30 @@ class Auth:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-        try:
-
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
+        token_key = hashlib.sha256(token.encode()).digest()
+        email = self.token_cache.get(token_key)
+        if email is None:
+            try:
+                payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+                if payload['scope'] == 'access_token':
+                    email = payload["sub"]
+                    if email is None:
+                        raise credentials_exception
+                else:
                     raise credentials_exception
-            else:
+            except JWTError as e:
                 raise credentials_exception
-        except JWTError as e:
-            raise credentials_exception
-
-        user_hash = str(email)
-        user = self.cache.get(user_hash)
+            ttl = min(payload["exp"] - time.time(), self.token_cache.ttl)
+            if ttl > 0:
+                self.token_cache.set(token_key, email, ttl)
 
+        user = await self.cache.get(email)
         if user is None:
-            print('User BD')
+            version = await self.cache.version(email)
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
                 raise credentials_exception
-            self.cache.set(user_hash, pickle.dumps(user))
-            self.cache.expire(user_hash, 300)
-        else:
-            print('User hash')
-            user = pickle.loads(user)
+            await self.cache.set(user, version)
         return user
 
     def create_email_token(self, data: dict):
@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path, PurePosixPath
+from urllib.parse import urlsplit
+
+import cloudinary
+import cloudinary.uploader
+from PIL import Image, ImageOps
+
+from src.conf.config import config
+
+DIGEST_LENGTH = 32
+IMAGE_FORMATS = ("PNG", "JPEG", "GIF", "WEBP")
+
+
+class InvalidAvatar(ValueError):
+    """
+    Raised when the uploaded file is not an image the pipeline can store
+    """
+
+
+def content_digest(data: bytes) -> str:
+    """
+    Hash of the uploaded bytes, part of every avatar URL
+
+    :param data: bytes: Uploaded file
+    :return: str: Hex digest of DIGEST_LENGTH characters
+    """
+    return hashlib.sha256(data).hexdigest()[:DIGEST_LENGTH]
+
+
+def url_digest(url: str | None) -> str | None:
+    """
+    Read the content digest back from an avatar URL built by one of the storages
+
+    :param url: str | None: Current avatar URL, e.g. a Gravatar URL or None
+    :return: str | None: Digest or None when the URL was not built by a storage
+    """
+    if not url:
+        return None
+    stem = PurePosixPath(urlsplit(url).path).stem
+    return stem if len(stem) == DIGEST_LENGTH else None
+
+
+def resize_avatar(data: bytes, size: int) -> tuple[bytes, str]:
+    """
+    Crop the image to a square, downscale it to size x size and encode it as JPEG
+
+    :param data: bytes: Uploaded file
+    :param size: int: Width and height in pixels
+    :return: tuple[bytes, str]: Encoded image and its file extension
+    """
+    try:
+        with Image.open(io.BytesIO(data), formats=IMAGE_FORMATS) as image:
+            # let the JPEG decoder scale down while decoding instead of decoding the full size first
+            image.draft("RGB", (size, size))
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, "white")
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            image = ImageOps.fit(image.convert("RGB"), (size, size), Image.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=85, optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError) as err:
+        raise InvalidAvatar() from err
+    return output.getvalue(), "jpg"
+
+
+class LocalAvatarStorage:
+    """
+    Avatar storage on the local filesystem, the files are served by the app under base_url
+
+    Every user has one directory with one file named after the content digest,
+    files of previous avatars are removed after the new one is written.
+
+    :param root: str: Directory of the avatar files
+    :param base_url: str: URL prefix the directory is served under
+    """
+
+    def __init__(self, root: str, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+
+    def _write(self, owner: str, name: str, data: bytes):
+        directory = self.root / owner
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp, directory / name)
+        for path in directory.iterdir():
+            if path.name != name:
+                path.unlink(missing_ok=True)
+
+    async def save(self, owner: str, digest: str, data: bytes, ext: str) -> str:
+        """
+        Write the avatar file in a worker thread
+
+        :param owner: str: Id of the user
+        :param digest: str: Content digest of the upload
+        :param data: bytes: Processed image
+        :param ext: str: File extension
+        :return: str: Avatar URL
+        """
+        name = f"{digest}.{ext}"
+        await asyncio.to_thread(self._write, owner, name, data)
+        return f"{self.base_url}/{owner}/{name}"
+
+
+class CloudinaryAvatarStorage:
+    """
+    Avatar storage on Cloudinary, the blocking upload runs in a worker thread
+
+    :param folder: str: Folder of the avatars
+    :param size: int: Width and height of the delivered image
+    """
+
+    def __init__(self, folder: str, size: int):
+        self.folder = folder
+        self.size = size
+
+    async def save(self, owner: str, digest: str, data: bytes, ext: str) -> str:
+        """
+        Upload the avatar and build its delivery URL
+
+        :param owner: str: Id of the user
+        :param digest: str: Content digest of the upload
+        :param data: bytes: Processed image
+        :param ext: str: File extension
+        :return: str: Avatar URL
+        """
+        public_id = f"{self.folder}/{owner}/{digest}"
+        await asyncio.to_thread(cloudinary.uploader.upload, data, public_id=public_id, overwrite=True)
+        return cloudinary.CloudinaryImage(public_id).build_url(width=self.size, height=self.size, crop="fill")
+
+
+class AvatarPipeline:
+    """
+    Hash, resize and store uploaded avatars without blocking the event loop
+
+    The digest of the uploaded bytes is part of the avatar URL, uploading the current avatar again
+    is detected before any image work and returns the current URL.
+
+    :param storage: LocalAvatarStorage | CloudinaryAvatarStorage: Where the avatars are stored
+    :param size: int: Width and height in pixels
+    :param max_bytes: int: Largest accepted upload
+    """
+
+    def __init__(self, storage, size: int = 250, max_bytes: int = 5 * 1024 * 1024):
+        self.storage = storage
+        self.size = size
+        self.max_bytes = max_bytes
+        self.uploads = 0
+        self.skipped = 0
+
+    async def update(self, owner: str, data: bytes, current_url: str | None) -> str | None:
+        """
+        Store a new avatar unless it is the current one
+
+        :param owner: str: Id of the user
+        :param data: bytes: Uploaded file
+        :param current_url: str | None: Current avatar URL of the user
+        :return: str | None: New avatar URL or None when the upload matches the current avatar
+        """
+        digest = await asyncio.to_thread(content_digest, data)
+        if digest == url_digest(current_url):
+            self.skipped += 1
+            return None
+        image, ext = await asyncio.to_thread(resize_avatar, data, self.size)
+        url = await self.storage.save(owner, digest, image, ext)
+        self.uploads += 1
+        return url
+
+    def stats(self) -> dict:
+        """
+        Return upload counters of the pipeline
+
+        :return: dict: Pipeline statistics
+        """
+        return {"storage": type(self.storage).__name__, "uploads": self.uploads, "skipped": self.skipped}
+
+
+if config.AVATAR_STORAGE == 'local':
+    avatar_storage = LocalAvatarStorage(config.AVATAR_LOCAL_DIR, config.AVATAR_LOCAL_URL)
+else:
+    cloudinary.config(cloud_name=config.CLD_NAME, api_key=config.CLD_API_KEY,
+                      api_secret=config.CLD_API_SECRET, secure=True)
+    avatar_storage = CloudinaryAvatarStorage(config.CLD_FOLDER, config.AVATAR_SIZE)
+
+avatar_pipeline = AvatarPipeline(avatar_storage, config.AVATAR_SIZE, config.AVATAR_MAX_BYTES)
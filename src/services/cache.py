@@ -0,0 +1,283 @@
+import json
+import time
+from collections import OrderedDict
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+from src.entity.models import User
+from src.services.invalidation import LocalInvalidationBus, RedisInvalidationBus
+
+USER_FIELDS = ("id", "username", "email", "password", "avatar", "confirmed")
+
+
+class LRUCache:
+    """
+    In-process LRU cache with a time to live for every entry
+
+    :param maxsize: int: Maximum number of entries kept in memory
+    :param ttl: float: Default time to live of an entry in seconds
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Return the value stored under key or None if it is missing or expired
+
+        :param key: Key of the entry
+        :return: Stored value or None
+        """
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        value, expires = item
+        if expires <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float | None = None):
+        """
+        Store value under key and evict the least recently used entries above maxsize
+
+        :param key: Key of the entry
+        :param value: Value to store
+        :param ttl: float: Time to live in seconds, defaults to the cache ttl
+        :return: None
+        """
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        """
+        Remove the entry stored under key
+
+        :param key: Key of the entry
+        :return: None
+        """
+        self._data.pop(key, None)
+
+    def prune(self):
+        """
+        Drop expired entries from the least recently used end, stops at the first live entry
+
+        :return: None
+        """
+        now = time.monotonic()
+        while self._data:
+            key, (_, expires) = next(iter(self._data.items()))
+            if expires > now:
+                return
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """
+        Return size and hit/miss counters of the cache
+
+        :return: dict: Cache statistics
+        """
+        total = self.hits + self.misses
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0}
+
+
+def dump_user(user: User) -> list:
+    """
+    Convert a user into a compact record without any ORM state
+
+    :param user: User: User to convert
+    :return: list: Values of USER_FIELDS
+    """
+    return [getattr(user, field) for field in USER_FIELDS]
+
+
+def load_user(record: list) -> User:
+    """
+    Build a detached user from a record created by dump_user
+
+    :param record: list: Values of USER_FIELDS
+    :return: User: Transient user object
+    """
+    return User(**dict(zip(USER_FIELDS, record)))
+
+
+class UserCache:
+    """
+    Two-tier cache of users: an in-process LRU in front of Redis
+
+    A request that misses the cache takes the version of the user before reading the row from the database and
+    passes it to set. Every invalidation bumps the version first, so a row read before a concurrent update
+    is not stored over the invalidation: Redis compares the version and writes the entry in one script,
+    the local tier compares the invalidations this worker has seen, its own and those from the bus.
+
+    :param client: redis.Redis | None: Async Redis client, None keeps only the local tier
+    :param ttl: int: Time to live of Redis entries in seconds
+    :param local: LRUCache: In-process tier
+    :param bus: LocalInvalidationBus | None: Bus that evicts the local tier of every worker
+    """
+
+    prefix = "user:"
+    version_prefix = "user-version:"
+    namespace = "user"
+    fill_script = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+    def __init__(self, client: redis.Redis | None, ttl: int, local: LRUCache,
+                 bus: LocalInvalidationBus | None = None):
+        self.client = client
+        self.ttl = ttl
+        self.local = local
+        self.bus = None
+        # invalidation counter of this worker and the counter value of the latest invalidation per email,
+        # emails dropped from the bounded map are covered by floor, the newest dropped value
+        self.invalidations = 0
+        self._invalidated: OrderedDict = OrderedDict()
+        self._floor = 0
+        if bus is not None:
+            self.attach(bus)
+
+    def attach(self, bus: LocalInvalidationBus):
+        """
+        Evict the local tier on every invalidation published to bus
+
+        :param bus: LocalInvalidationBus: Invalidation bus
+        :return: None
+        """
+        self.bus = bus
+        bus.subscribe(self.namespace, self._evict)
+
+    def _evict(self, email: str):
+        self.local.pop(email)
+        self.invalidations += 1
+        self._invalidated[email] = self.invalidations
+        self._invalidated.move_to_end(email)
+        while len(self._invalidated) > self.local.maxsize:
+            _, self._floor = self._invalidated.popitem(last=False)
+
+    async def version(self, email: str) -> tuple[int, int]:
+        """
+        Take the version of a user before reading it from the database, pass it to set
+
+        :param email: str: Email of the user
+        :return: tuple[int, int]: Invalidations seen by this worker and the Redis version, -1 if Redis is down
+        """
+        remote = 0
+        if self.client is not None:
+            try:
+                remote = int(await self.client.get(self.version_prefix + email) or 0)
+            except RedisError as err:
+                print(err)
+                remote = -1
+        return self.invalidations, remote
+
+    async def get(self, email: str) -> User | None:
+        """
+        Get a user from the local tier and fall back to Redis
+
+        :param email: str: Email of the user
+        :return: User | None: Cached user or None
+        """
+        record = self.local.get(email)
+        if record is None and self.client is not None:
+            try:
+                data = await self.client.get(self.prefix + email)
+            except RedisError as err:
+                print(err)
+                data = None
+            if data is not None:
+                record = json.loads(data)
+                self.local.set(email, record)
+        if record is None:
+            return None
+        return load_user(record)
+
+    async def set(self, user: User, version: tuple[int, int] | None = None):
+        """
+        Store a user in both tiers with a single SET ... EX to Redis.
+        With a version the user is only stored if it was not invalidated since the version was taken.
+
+        :param user: User: User to store
+        :param version: tuple[int, int]: Version from version(), taken before the user was read
+        :return: None
+        """
+        record = dump_user(user)
+        if version is not None and self._invalidated.get(user.email, self._floor) > version[0]:
+            return
+        if self.client is not None and (version is None or version[1] >= 0):
+            data = json.dumps(record, separators=(",", ":"))
+            try:
+                if version is None:
+                    await self.client.set(self.prefix + user.email, data, ex=self.ttl)
+                elif not await self.client.eval(self.fill_script, 2, self.prefix + user.email,
+                                                self.version_prefix + user.email, version[1], data, self.ttl):
+                    return
+            except RedisError as err:
+                print(err)
+        self.local.set(user.email, record)
+
+    async def delete(self, email: str):
+        """
+        Remove a user from both tiers
+
+        :param email: str: Email of the user
+        :return: None
+        """
+        self.local.pop(email)
+        if self.client is not None:
+            try:
+                await self.client.delete(self.prefix + email)
+            except RedisError as err:
+                print(err)
+
+    async def invalidate(self, email: str):
+        """
+        Bump the version of a user, then remove it from Redis and from the local tier of every worker
+
+        :param email: str: Email of the user
+        :return: None
+        """
+        self._evict(email)
+        if self.client is not None:
+            try:
+                await self.client.incr(self.version_prefix + email)
+                await self.client.expire(self.version_prefix + email, self.ttl)
+            except RedisError as err:
+                print(err)
+        await self.delete(email)
+        if self.bus is not None:
+            await self.bus.publish(self.namespace, email)
+
+
+redis_client = redis.Redis(host=config.REDIS_DOMAIN, port=config.REDIS_PORT, password=config.REDIS_PASSWORD, db=0)
+
+if config.INVALIDATION_BUS == 'local':
+    invalidation_bus = LocalInvalidationBus()
+else:
+    invalidation_bus = RedisInvalidationBus(redis_client, config.INVALIDATION_CHANNEL)
+
+user_cache = UserCache(redis_client, config.USER_CACHE_TTL,
+                       LRUCache(config.USER_CACHE_LOCAL_SIZE, config.USER_CACHE_LOCAL_TTL), invalidation_bus)
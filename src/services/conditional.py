@@ -0,0 +1,93 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+
+def make_etag(body: bytes) -> str:
+    """
+    Strong entity tag of a rendered body
+
+    :param body: bytes: Response body
+    :return: str: Quoted entity tag
+    """
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def version_etag(*parts) -> str:
+    """
+    Strong entity tag derived from what identifies a version of the response instead of its body
+
+    :param parts: Values that change whenever the body changes, e.g. a cache key with the generation of its user
+    :return: str: Quoted entity tag
+    """
+    return '"' + hashlib.sha256("\n".join(map(str, parts)).encode()).hexdigest()[:32] + '"'
+
+
+def http_date(value: datetime) -> str:
+    """
+    Format a timestamp for Last-Modified, naive timestamps from the database are UTC
+
+    :param value: datetime: Timestamp
+    :return: str: HTTP date like Sun, 18 Oct 2026 10:00:00 GMT
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def last_modified(rows) -> str | None:
+    """
+    Last-Modified of a list of contact rows
+
+    :param rows: Iterable[Row]: Rows with an updated_at column
+    :return: str | None: HTTP date of the newest row or None if no row has a timestamp
+    """
+    timestamps = [row.updated_at for row in rows if row.updated_at is not None]
+    return http_date(max(timestamps)) if timestamps else None
+
+
+def if_none_match_tags(headers) -> set[str] | None:
+    """
+    Entity tags listed in If-None-Match
+
+    :param headers: Mapping: Request headers
+    :return: set[str] | None: Tags, None without the header
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is None:
+        return None
+    return {tag.strip() for tag in if_none_match.split(",")}
+
+
+def etag_matches(headers, etag: str) -> bool:
+    """
+    Check that If-None-Match names etag itself. Unlike *, which only says that some representation exists,
+    a named tag can be answered with 304 before the resource is loaded.
+
+    :param headers: Mapping: Request headers
+    :param etag: str: Current entity tag
+    :return: bool: True if the client copy has this entity tag
+    """
+    tags = if_none_match_tags(headers)
+    return tags is not None and (etag in tags or f"W/{etag}" in tags)
+
+
+def is_not_modified(headers, etag: str | None, modified: str | None) -> bool:
+    """
+    Evaluate If-None-Match and, only without it, If-Modified-Since against the current representation
+
+    :param headers: Mapping: Request headers
+    :param etag: str: Current entity tag
+    :param modified: str: Current Last-Modified
+    :return: bool: True if the client copy is current and 304 can be sent
+    """
+    tags = if_none_match_tags(headers)
+    if tags is not None:
+        return etag is not None and ("*" in tags or etag in tags or f"W/{etag}" in tags)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is None or modified is None:
+        return False
+    try:
+        return parsedate_to_datetime(modified) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
@@ -1,11 +1,14 @@
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
 
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr, BaseModel
 from typing import List
 
 from src.services.auth import auth_service
+from src.services.mailer import mailer
 from src.conf.config import config
 
 
@@ -13,43 +16,52 @@ class EmailSchema(BaseModel):
     email: EmailStr
 
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=config.MAIL_USERNAME,
-    MAIL_PASSWORD=config.MAIL_PASSWORD,
-    MAIL_FROM=config.MAIL_USERNAME,
-    MAIL_PORT=config.MAIL_PORT,
-    MAIL_SERVER=config.MAIL_SERVER,
-    MAIL_FROM_NAME="CONTACTS APP",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+templates = Environment(loader=FileSystemLoader(Path(__file__).parent / 'templates'), autoescape=select_autoescape())
+
+
+def build_message(recipient: str, subject: str, template_name: str, template_body: dict) -> EmailMessage:
+    """
+    Render an HTML template into a message from MAIL_FROM
+
+    :param recipient: str: Email address
+    :param subject: str: Subject
+    :param template_name: str: Template in src/services/templates
+    :param template_body: dict: Template variables
+    :return: EmailMessage: Message ready for the mailer
+    """
+    message = EmailMessage()
+    message["From"] = formataddr(("CONTACTS APP", config.MAIL_FROM))
+    message["To"] = recipient
+    message["Subject"] = subject
+    message.set_content(templates.get_template(template_name).render(**template_body), subtype="html")
+    return message
 
 
 async def send_email(email: str, username: str, host: str):
     """
-    Send email with token for verification
+    Queue email with token for verification
 
     :param email: str: Email address
     :param username: str: Username
     :param host: str: Host address
     :return: None
     """
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Verify your email",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="verify_email.html")
+    token_verification = auth_service.create_email_token({"sub": email})
+    message = build_message(email, "Verify your email", "verify_email.html",
+                            {"host": host, "username": username, "token": token_verification})
+    await mailer.enqueue(message)
 
-    except ConnectionError as e:
-        print(e)
 
+async def send_birthday_digests(digests: List[dict], days: int) -> int:
+    """
+    Queue a batch of birthday digests for the pooled mailer
 
+    :param digests: List[dict]: Digests with email, username and contacts
+    :param days: int: Length of the birthday window
+    :return: int: Number of queued digests
+    """
+    for digest in digests:
+        await mailer.enqueue(build_message(
+            digest["email"], "Upcoming birthdays of your contacts", "birthday_digest.html",
+            {"username": digest["username"], "days": days, "contacts": digest["contacts"]}))
+    return len(digests)
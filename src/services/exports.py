@@ -0,0 +1,41 @@
+import csv
+import io
+import json
+
+from src.schemas.contact import ContactResponse
+
+EXPORT_FIELDS = tuple(ContactResponse.model_fields)
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+async def ndjson_chunks(partitions):
+    """
+    Encode partitions of contact rows as NDJSON, one chunk per partition
+
+    :param partitions: AsyncIterator[list[Row]]: Rows with the EXPORT_FIELDS columns
+    :return: AsyncIterator[bytes]
+    """
+    async for rows in partitions:
+        yield "".join(json.dumps(dict(zip(EXPORT_FIELDS, row)), default=str) + "\n" for row in rows).encode()
+
+
+async def csv_chunks(partitions):
+    """
+    Encode partitions of contact rows as CSV with a header line, one chunk per partition
+
+    :param partitions: AsyncIterator[list[Row]]: Rows with the EXPORT_FIELDS columns
+    :return: AsyncIterator[bytes]
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue().encode()
+    async for rows in partitions:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+
+
+def export_chunks(partitions, fmt: str):
+    return csv_chunks(partitions) if fmt == "csv" else ndjson_chunks(partitions)
@@ -0,0 +1,116 @@
+import csv
+import io
+import json
+from itertools import islice
+from typing import BinaryIO, Iterator
+
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from src.schemas.contact import ContactSchema
+
+IMPORT_FORMATS = {
+    "csv": "csv", "text/csv": "csv", "application/csv": "csv",
+    "ndjson": "ndjson", "jsonl": "ndjson", "application/x-ndjson": "ndjson", "application/jsonl": "ndjson",
+}
+
+
+def detect_format(filename: str | None, content_type: str | None) -> str | None:
+    """
+    Guess the import format from the file name or the content type of an upload
+
+    :param filename: str: Name of the uploaded file
+    :param content_type: str: Content type of the uploaded file
+    :return: str | None: 'csv', 'ndjson' or None if unknown
+    """
+    if filename and "." in filename:
+        fmt = IMPORT_FORMATS.get(filename.rsplit(".", 1)[1].lower())
+        if fmt:
+            return fmt
+    if content_type:
+        return IMPORT_FORMATS.get(content_type.split(";")[0].strip().lower())
+    return None
+
+
+def parse_rows(file: BinaryIO, fmt: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    """
+    Lazily parse an uploaded file into rows, reading it line by line
+
+    :param file: BinaryIO: Uploaded file
+    :param fmt: str: 'csv' with a header line or 'ndjson' with one object per line
+    :return: Iterator of (row number, row or None, parse error or None), invalid UTF-8 ends the file with an error
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    number = 0
+    try:
+        if fmt == "csv":
+            for number, row in enumerate(csv.DictReader(text), 1):
+                yield number, row, None
+            return
+        for number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as err:
+                yield number, None, f"Invalid JSON: {err}"
+                continue
+            if not isinstance(row, dict):
+                yield number, None, "Row must be a JSON object"
+                continue
+            yield number, row, None
+    except UnicodeDecodeError as err:
+        # decoding runs ahead of the rows, the rest of the file cannot be read
+        yield number + 1, None, f"File is not valid UTF-8, rows from here on were not imported: {err}"
+    finally:
+        text.detach()
+
+
+class ContactImport:
+    """
+    Stream rows of an upload in batches of validated contacts and collect a per-row error report
+
+    :param file: BinaryIO: Uploaded file
+    :param fmt: str: 'csv' or 'ndjson'
+    :param user_id: int: Owner of the imported contacts
+    :param batch_size: int: Number of rows parsed and inserted at once
+    :param max_errors: int: Number of row errors kept in the report, further errors are only counted
+    """
+
+    def __init__(self, file: BinaryIO, fmt: str, user_id: int, batch_size: int = 1000, max_errors: int = 1000):
+        self.rows = parse_rows(file, fmt)
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.failed = 0
+        self.errors: list[dict] = []
+
+    def _error(self, number: int, messages: list[str]):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": number, "errors": messages})
+
+    async def batches(self):
+        """
+        Yield lists of validated contacts, parsing happens in a worker thread one batch at a time
+
+        :return: AsyncIterator[list[ContactSchema]]
+        """
+        while True:
+            rows = await run_in_threadpool(lambda: list(islice(self.rows, self.batch_size)))
+            if not rows:
+                return
+            batch = []
+            for number, row, error in rows:
+                if error is not None:
+                    self._error(number, [error])
+                    continue
+                try:
+                    batch.append(ContactSchema.model_validate({**row, "user_id": self.user_id}))
+                except ValidationError as err:
+                    self._error(number, [f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in err.errors()])
+            if batch:
+                yield batch
+
+    def report(self, inserted: int) -> dict:
+        return {"inserted": inserted, "failed": self.failed, "errors": self.errors}
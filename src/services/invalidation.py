@@ -0,0 +1,90 @@
+import asyncio
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+
+class LocalInvalidationBus:
+    """
+    In-memory invalidation bus that only reaches subscribers of this process, used in tests and single workers
+
+    :param handlers: dict: Handlers subscribed to every namespace
+    """
+
+    def __init__(self):
+        self.handlers: dict[str, list] = {}
+
+    def subscribe(self, namespace: str, handler):
+        """
+        Call handler with the key of every invalidation published in namespace
+
+        :param namespace: str: Namespace of the keys, must not contain ':'
+        :param handler: Callable taking the invalidated key
+        :return: None
+        """
+        self.handlers.setdefault(namespace, []).append(handler)
+
+    def dispatch(self, namespace: str, key: str):
+        for handler in self.handlers.get(namespace, []):
+            handler(key)
+
+    async def publish(self, namespace: str, key: str):
+        """
+        Invalidate key in namespace
+
+        :param namespace: str: Namespace of the key
+        :param key: str: Invalidated key
+        :return: None
+        """
+        self.dispatch(namespace, key)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class RedisInvalidationBus(LocalInvalidationBus):
+    """
+    Invalidation bus over Redis pub/sub that reaches every worker subscribed to the channel
+
+    :param client: redis.Redis: Async Redis client
+    :param channel: str: Pub/sub channel name
+    """
+
+    def __init__(self, client: redis.Redis, channel: str):
+        super().__init__()
+        self.client = client
+        self.channel = channel
+        self._task: asyncio.Task | None = None
+
+    async def publish(self, namespace: str, key: str):
+        self.dispatch(namespace, key)
+        try:
+            await self.client.publish(self.channel, f"{namespace}:{key}")
+        except RedisError as err:
+            print(err)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _listen(self):
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    namespace, _, key = message["data"].decode().partition(":")
+                    self.dispatch(namespace, key)
+            except RedisError as err:
+                print(err)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
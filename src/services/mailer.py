@@ -0,0 +1,215 @@
+import asyncio
+import time
+from collections import deque
+from email.message import EmailMessage
+
+import aiosmtplib
+
+from src.conf.config import config
+
+
+def is_answer(err: Exception) -> bool:
+    """
+    Tell errors answered by the server on a working connection from transport errors
+
+    :param err: Exception: Error raised while sending
+    :return: bool: True for SMTP replies other than a refused connection
+    """
+    return isinstance(err, (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused)) \
+        and not isinstance(err, ConnectionError)
+
+
+def is_permanent(err: Exception) -> bool:
+    """
+    Tell a permanent rejection (5xx) from transport errors and temporary 4xx answers that are worth retrying
+
+    :param err: Exception: Error raised while sending
+    :return: bool: True if sending the message again cannot succeed
+    """
+    if not is_answer(err):
+        return False
+    if isinstance(err, aiosmtplib.SMTPRecipientsRefused):
+        return bool(err.recipients) and all(recipient.code >= 500 for recipient in err.recipients)
+    return err.code >= 500
+
+
+class SMTPMailer:
+    """
+    Queue of outgoing messages delivered by a small pool of persistent SMTP connections
+
+    Every worker keeps its connection open between messages, takes up to batch_size queued messages at once
+    and sends them over that connection. Transport errors are retried on a fresh connection and temporary 4xx
+    answers on the same one, both with exponential backoff, and count as failed after max_retries retries.
+    A permanent 5xx rejection counts as failed at once and keeps the connection. Any other error, e.g. a message
+    that cannot be encoded, fails only that message and the worker goes on with a fresh connection.
+
+    :param hostname: str: SMTP server
+    :param port: int: SMTP port
+    :param username: str: Login, None to skip authentication
+    :param password: str: Password
+    :param use_tls: bool: Implicit TLS, e.g. on port 465
+    :param start_tls: bool: Upgrade with STARTTLS after connecting
+    :param pool_size: int: Number of connections and workers
+    :param batch_size: int: Messages a worker takes from the queue at once
+    :param max_retries: int: Attempts after the first failed one
+    :param backoff: float: Delay before the first retry in seconds, doubled on every retry
+    :param queue_size: int: Queued messages above which enqueue waits
+    :param timeout: float: SMTP timeout in seconds
+    :param client_factory: Callable building an aiosmtplib.SMTP like client from keyword arguments
+    """
+
+    rate_window = 60
+
+    def __init__(self, hostname: str, port: int, username: str | None = None, password: str | None = None,
+                 use_tls: bool = True, start_tls: bool = False, pool_size: int = 2, batch_size: int = 50,
+                 max_retries: int = 3, backoff: float = 1.0, queue_size: int = 10000, timeout: float = 30,
+                 client_factory=aiosmtplib.SMTP):
+        self.options = {"hostname": hostname, "port": port, "use_tls": use_tls, "start_tls": start_tls,
+                        "timeout": timeout}
+        self.username = username
+        self.password = password
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.queue_size = queue_size
+        self.client_factory = client_factory
+        self.queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._clients: list = []
+        self._sent_at: deque = deque()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.connects = 0
+
+    async def start(self):
+        """
+        Start the workers, messages enqueued before are kept
+
+        :return: None
+        """
+        if self._workers:
+            return
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.queue_size)
+        self._clients = [None] * self.pool_size
+        self._workers = [asyncio.create_task(self._work(index)) for index in range(self.pool_size)]
+
+    async def stop(self, timeout: float = 10):
+        """
+        Deliver the queued messages for up to timeout seconds, then stop the workers and close the connections
+
+        :param timeout: float: Seconds to wait for the queue to drain
+        :return: None
+        """
+        if self.queue is not None and self._workers:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Mailer stopped with {self.queue.qsize()} queued messages")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for index in range(len(self._clients)):
+            await self._close(index)
+
+    async def enqueue(self, message: EmailMessage):
+        """
+        Queue a message for delivery, waits while the queue is full
+
+        :param message: EmailMessage: Message with From, To and Subject headers
+        :return: None
+        """
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.queue_size)
+        await self.queue.put(message)
+
+    async def _client(self, index: int):
+        client = self._clients[index]
+        if client is None or not client.is_connected:
+            client = self.client_factory(**self.options)
+            await client.connect()
+            if self.username:
+                await client.login(self.username, self.password)
+            self._clients[index] = client
+            self.connects += 1
+        return client
+
+    async def _close(self, index: int):
+        client = self._clients[index]
+        self._clients[index] = None
+        if client is None:
+            return
+        try:
+            if client.is_connected:
+                await client.quit()
+        except Exception:
+            client.close()
+
+    async def _deliver(self, index: int, message: EmailMessage):
+        for attempt in range(self.max_retries + 1):
+            try:
+                client = await self._client(index)
+                await client.send_message(message)
+                self.sent += 1
+                self._sent_at.append(time.monotonic())
+                return
+            except (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError) as err:
+                print(err)
+                if is_permanent(err):
+                    # the server refused the message, aiosmtplib reset the envelope and the connection stays usable
+                    self.failed += 1
+                    return
+                if not is_answer(err):
+                    await self._close(index)
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    return
+                self.retried += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def _work(self, index: int):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            for message in batch:
+                try:
+                    await self._deliver(index, message)
+                except Exception as err:
+                    # a broken message or client must not end the worker and leave the batch unacknowledged,
+                    # the state of the connection is unknown so the next message gets a fresh one
+                    print(err)
+                    self.failed += 1
+                    await self._close(index)
+                finally:
+                    self.queue.task_done()
+
+    def send_rate(self) -> float:
+        """
+        Messages sent per second over the last rate_window seconds
+
+        :return: float: Send rate
+        """
+        horizon = time.monotonic() - self.rate_window
+        while self._sent_at and self._sent_at[0] < horizon:
+            self._sent_at.popleft()
+        return len(self._sent_at) / self.rate_window
+
+    def stats(self) -> dict:
+        """
+        Return delivery counters, queue depth and send rate of the mailer
+
+        :return: dict: Mailer statistics
+        """
+        return {"queue_depth": self.queue.qsize() if self.queue is not None else 0, "sent": self.sent,
+                "failed": self.failed, "retried": self.retried, "connects": self.connects,
+                "send_rate": self.send_rate(), "workers": len(self._workers)}
+
+
+mailer = SMTPMailer(config.MAIL_SERVER, config.MAIL_PORT, config.MAIL_USERNAME, config.MAIL_PASSWORD,
+                    use_tls=config.MAIL_SSL_TLS, start_tls=config.MAIL_STARTTLS, pool_size=config.MAIL_POOL_SIZE,
+                    batch_size=config.MAIL_BATCH_SIZE, max_retries=config.MAIL_MAX_RETRIES,
+                    backoff=config.MAIL_RETRY_BACKOFF, queue_size=config.MAIL_QUEUE_SIZE)
@@ -0,0 +1,155 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+from passlib.context import CryptContext
+
+from src.conf.config import config
+
+BCRYPT_MIN_ROUNDS = 4
+BCRYPT_MAX_ROUNDS = 31
+
+
+def build_context(rounds: int) -> CryptContext:
+    """
+    Build a bcrypt context that hashes with rounds and marks hashes of any other cost for update
+
+    :param rounds: int: bcrypt cost factor
+    :return: CryptContext: Password context
+    """
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=rounds,
+                        bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds)
+
+
+pwd_context = build_context(config.BCRYPT_ROUNDS)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def get_rounds(hashed_password: str) -> int | None:
+    """
+    Read the cost factor of a bcrypt hash
+
+    :param hashed_password: str: Hash like $2b$12$...
+    :return: int | None: Cost factor or None for non bcrypt hashes
+    """
+    parts = hashed_password.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def measure_rounds(rounds: int, samples: int = 3) -> float:
+    """
+    Measure the fastest of samples bcrypt hashes with the given cost
+
+    :param rounds: int: bcrypt cost factor
+    :param samples: int: Number of hashes to time
+    :return: float: Seconds per hash
+    """
+    best = float("inf")
+    for _ in range(samples):
+        salt = bcrypt.gensalt(rounds)
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration password", salt)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibrate_rounds(target_ms: float, min_rounds: int = BCRYPT_MIN_ROUNDS,
+                     max_rounds: int = BCRYPT_MAX_ROUNDS) -> tuple[int, dict[int, float]]:
+    """
+    Pick the highest bcrypt cost whose hash time on this machine stays within target_ms
+
+    :param target_ms: float: Latency budget of a single hash in milliseconds
+    :param min_rounds: int: Lowest cost to consider
+    :param max_rounds: int: Highest cost to consider
+    :return: tuple[int, dict[int, float]]: Chosen cost and measured milliseconds per cost
+    """
+    timings = {min_rounds: measure_rounds(min_rounds) * 1000}
+    rounds = min_rounds
+    while rounds < max_rounds:
+        # every extra round doubles the work, stop before measuring a cost that cannot fit
+        if timings[rounds] * 2 > target_ms * 1.5:
+            break
+        timings[rounds + 1] = measure_rounds(rounds + 1) * 1000
+        if timings[rounds + 1] > target_ms:
+            break
+        rounds += 1
+    return rounds, timings
+
+
+class PasswordPoolBusy(Exception):
+    """
+    Raised when the password pool already has max_pending jobs queued or running
+    """
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt off the event loop on a bounded worker pool
+
+    :param kind: str: 'thread' or 'process' pool
+    :param workers: int: Number of workers in the pool
+    :param max_pending: int: Jobs queued or running above which new work is rejected
+    """
+
+    def __init__(self, kind: str = "thread", workers: int = 4, max_pending: int = 32):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+        return self._executor
+
+    async def run(self, func, *args):
+        """
+        Run func in the pool or fail fast when the pool is saturated
+
+        :param func: Module level function to run
+        :param args: Arguments for func
+        :return: Result of func
+        """
+        if self.pending >= self.max_pending:
+            raise PasswordPoolBusy()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.run(verify_password, plain_password, hashed_password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+        return await self.run(verify_and_update_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(config.PASSWORD_EXECUTOR, config.PASSWORD_WORKERS, config.PASSWORD_MAX_PENDING)
@@ -0,0 +1,206 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request, status
+from fastapi_limiter.depends import RateLimiter
+from redis.exceptions import RedisError
+
+from src.conf import messages
+from src.conf.config import config
+from src.services.cache import redis_client
+
+
+class Bucket:
+    """
+    Token bucket of one key, holds up to times tokens and refills times tokens per seconds
+
+    :param times: int: Allowed requests per window
+    :param seconds: float: Length of the window
+    :param now: float: Monotonic time of the first request
+    """
+
+    __slots__ = ("times", "seconds", "tokens", "updated", "pending", "window", "accounted")
+
+    def __init__(self, times: int, seconds: float, now: float):
+        self.times = times
+        self.seconds = seconds
+        self.tokens = float(times)
+        self.updated = now
+        # requests taken since the last reconciliation and the global count already taken into account
+        self.pending = 0
+        self.window = None
+        self.accounted = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.times, self.tokens + (now - self.updated) * self.times / self.seconds)
+        self.updated = now
+
+
+class TokenBucketLimiter:
+    """
+    Rate limiter that decides from in-process token buckets and reconciles them with Redis in the background
+
+    A request only takes a token from the local bucket of its key. Every sync_interval seconds the worker adds
+    its consumption to a Redis counter per key and window in one pipelined round trip, and takes what the other
+    workers consumed since the last round off its local buckets. Between two rounds every worker decides alone,
+    so with n workers a key can get up to about (n - 1) * times / seconds * sync_interval requests above the
+    limit, a shorter interval tightens the bound at the cost of more Redis traffic. Without a Redis client the
+    limits are per worker.
+
+    :param client: redis.Redis | None: Async Redis client, None to limit per worker only
+    :param sync_interval: float: Seconds between two reconciliations
+    :param size: int: Maximum number of buckets kept in memory
+    """
+
+    prefix = "ratelimit:"
+
+    def __init__(self, client, sync_interval: float = 1.0, size: int = 10000):
+        self.client = client
+        self.sync_interval = sync_interval
+        self.size = size
+        self._buckets: OrderedDict[str, Bucket] = OrderedDict()
+        self._task: asyncio.Task | None = None
+        self.allowed = 0
+        self.rejected = 0
+        self.syncs = 0
+        self.sync_errors = 0
+
+    def acquire(self, key: str, times: int, seconds: float) -> float:
+        """
+        Take a token from the bucket of key
+
+        :param key: str: Key of the limited client and route
+        :param times: int: Allowed requests per window
+        :param seconds: float: Length of the window
+        :return: float: 0 if the request is allowed, otherwise seconds until the next token
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = Bucket(times, seconds, now)
+            while len(self._buckets) > self.size:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.refill(now)
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.pending += 1
+            self.allowed += 1
+            return 0
+        self.rejected += 1
+        return (1 - bucket.tokens) * seconds / times
+
+    async def sync(self):
+        """
+        Push the local consumption of the active keys to Redis and apply the consumption of the other workers.
+        Buckets that were idle for a whole window are full again and dropped.
+
+        :return: None
+        """
+        now = time.monotonic()
+        for key in [key for key, bucket in self._buckets.items()
+                    if not bucket.pending and now - bucket.updated >= bucket.seconds]:
+            del self._buckets[key]
+        if self.client is None or not self._buckets:
+            return
+        wall = time.time()
+        active = []
+        pipe = self.client.pipeline(transaction=False)
+        for key, bucket in self._buckets.items():
+            window = int(wall // bucket.seconds)
+            redis_key = f"{self.prefix}{key}:{window}"
+            pipe.incrby(redis_key, bucket.pending)
+            pipe.expire(redis_key, math.ceil(bucket.seconds) * 2)
+            active.append((bucket, window, bucket.pending))
+        try:
+            results = await pipe.execute()
+        except (RedisError, OSError) as err:
+            print(err)
+            self.sync_errors += 1
+            return
+        self.syncs += 1
+        for (bucket, window, sent), total in zip(active, results[::2]):
+            if bucket.window != window:
+                bucket.window = window
+                bucket.accounted = 0
+            others = total - bucket.accounted - sent
+            bucket.accounted = total
+            bucket.pending -= sent
+            if others > 0:
+                bucket.tokens = max(bucket.tokens - others, 0.0)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+
+    async def start(self):
+        if self._task is None and self.client is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            await self.sync()
+
+    def stats(self) -> dict:
+        """
+        Return decision and reconciliation counters of the limiter
+
+        :return: dict: Limiter statistics
+        """
+        return {"keys": len(self._buckets), "allowed": self.allowed, "rejected": self.rejected,
+                "syncs": self.syncs, "sync_errors": self.sync_errors, "sync_interval": self.sync_interval}
+
+
+def client_ip(request: Request) -> str:
+    forwarded = request.headers.get("X-Forwarded-For")
+    return forwarded.split(",")[0] if forwarded else request.client.host
+
+
+class RateLimit:
+    """
+    Dependency limiting every client to times requests per seconds with the local token bucket limiter.
+    Without a scope every path has its own limit, routes sharing a scope share one limit.
+
+    :param times: int: Allowed requests per window
+    :param seconds: float: Length of the window
+    :param scope: str: Name of a limit shared by several routes
+    :param limiter: TokenBucketLimiter: Limiter to use, defaults to the rate_limiter of the module
+    """
+
+    def __init__(self, times: int, seconds: float, scope: str | None = None,
+                 limiter: TokenBucketLimiter | None = None):
+        self.times = times
+        self.seconds = seconds
+        self.scope = scope
+        self.limiter = limiter
+
+    async def __call__(self, request: Request):
+        limiter = self.limiter or rate_limiter
+        key = f"{self.scope or request.scope['path']}:{client_ip(request)}"
+        retry_after = limiter.acquire(key, self.times, self.seconds)
+        if retry_after:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=messages.TOO_MANY_REQUESTS,
+                                headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+def rate_limit(times: int, seconds: int, scope: str | None = None):
+    """
+    Build the rate limit dependency of the configured RATE_LIMITER
+
+    :param times: int: Allowed requests per window
+    :param seconds: int: Length of the window
+    :param scope: str: Name of a limit shared by several routes, only used by the local limiter
+    :return: RateLimit | RateLimiter: Dependency
+    """
+    if config.RATE_LIMITER == 'local':
+        return RateLimit(times, seconds, scope)
+    return RateLimiter(times=times, seconds=seconds)
+
+
+rate_limiter = TokenBucketLimiter(redis_client, config.RATE_LIMIT_SYNC_INTERVAL, config.RATE_LIMIT_SIZE)
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import random
+import time
+from collections import defaultdict
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+from src.services.cache import LRUCache, redis_client
+
+
+class ResponseCache:
+    """
+    Cache of rendered responses keyed by user, route and query parameters
+
+    Every key contains the generation of its user. Writes bump the generation, which makes all cached responses
+    of that user unreachable at once, old entries simply expire. The first write seeds the generation with the
+    current time, so generations are not handed out again after Redis lost them or the process restarted.
+
+    :param client: redis.Redis | None: Async Redis client, None keeps entries and generations in process
+    :param ttl: int: Time to live of an entry in seconds
+    :param jitter: float: Fraction of ttl randomly added to every entry so entries do not expire together
+    :param local: LRUCache: In-process entries, used when there is no Redis client
+    :param max_bytes: int: Responses with a larger body are not cached
+    :param settle: float: Seconds after a write during which responses read from a replica are not cached,
+        the replica may not have the write yet
+    """
+
+    prefix = "response:"
+    generation_prefix = "response-generation:"
+    bumped_prefix = "response-bumped:"
+
+    def __init__(self, client: redis.Redis | None, ttl: int, jitter: float, local: LRUCache, max_bytes: int,
+                 settle: float = 5):
+        self.client = client
+        self.ttl = ttl
+        self.jitter = jitter
+        self.local = local
+        self.max_bytes = max_bytes
+        self.settle = settle
+        self.generations: dict[int, int] = defaultdict(int)
+        self.bumped: dict[int, float] = {}
+        self.hits: dict[str, int] = defaultdict(int)
+        self.misses: dict[str, int] = defaultdict(int)
+
+    async def generation(self, user_id: int) -> int:
+        """
+        Current generation of the cached responses of a user
+
+        :param user_id: int: Id of the user
+        :return: int: Generation, 0 before the first write
+        """
+        if self.client is None:
+            return self.generations[user_id]
+        try:
+            return int(await self.client.get(f"{self.generation_prefix}{user_id}") or 0)
+        except RedisError as err:
+            print(err)
+            return -1
+
+    async def bump(self, user_id: int):
+        """
+        Invalidate every cached response of a user
+
+        :param user_id: int: Id of the user
+        :return: None
+        """
+        if self.client is None:
+            self.generations[user_id] = (self.generations[user_id] or time.time_ns()) + 1
+            self.bumped[user_id] = time.monotonic()
+            return
+        try:
+            await self.client.set(f"{self.generation_prefix}{user_id}", time.time_ns(), nx=True)
+            await self.client.incr(f"{self.generation_prefix}{user_id}")
+            await self.client.set(f"{self.bumped_prefix}{user_id}", 1, px=max(round(self.settle * 1000), 1))
+        except RedisError as err:
+            print(err)
+
+    async def settled(self, user_id: int) -> bool:
+        """
+        Check that the last write of a user is older than settle, so replicas may be used to fill the cache
+
+        :param user_id: int: Id of the user
+        :return: bool: True when no write happened within settle seconds, False also when Redis is unavailable
+        """
+        if self.client is None:
+            bumped = self.bumped.get(user_id)
+            return bumped is None or time.monotonic() - bumped >= self.settle
+        try:
+            return not await self.client.exists(f"{self.bumped_prefix}{user_id}")
+        except RedisError as err:
+            print(err)
+            return False
+
+    async def key(self, user_id: int, route: str, params: dict, generation: int | None = None) -> str | None:
+        """
+        Build the cache key of a response for the current generation of the user
+
+        :param user_id: int: Id of the user
+        :param route: str: Name of the route
+        :param params: dict: Query and path parameters that change the response
+        :param generation: int: Generation from generation(), looked up when omitted
+        :return: str | None: Cache key or None when the generation is unavailable
+        """
+        if generation is None:
+            generation = await self.generation(user_id)
+        if generation < 0:
+            return None
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:32]
+        return f"{self.prefix}{user_id}:{generation}:{route}:{digest}"
+
+    async def get(self, key: str | None, route: str) -> tuple[bytes, dict] | None:
+        """
+        Get a cached response and count a hit or a miss for route
+
+        :param key: str: Cache key from key()
+        :param route: str: Name of the route
+        :return: tuple[bytes, dict] | None: Body and headers or None
+        """
+        entry = None
+        if key is not None:
+            if self.client is None:
+                entry = self.local.get(key)
+            else:
+                try:
+                    data = await self.client.get(key)
+                except RedisError as err:
+                    print(err)
+                    data = None
+                if data is not None:
+                    headers, _, body = data.partition(b"\n")
+                    entry = body, json.loads(headers)
+        if entry is None:
+            self.misses[route] += 1
+        else:
+            self.hits[route] += 1
+        return entry
+
+    async def set(self, key: str | None, body: bytes, headers: dict):
+        """
+        Store a response with a jittered time to live unless it is larger than max_bytes
+
+        :param key: str: Cache key from key()
+        :param body: bytes: Rendered body
+        :param headers: dict: Headers that belong to the body
+        :return: None
+        """
+        if key is None or len(body) > self.max_bytes:
+            return
+        ttl = self.ttl + random.uniform(0, self.ttl * self.jitter)
+        if self.client is None:
+            self.local.set(key, (body, headers), ttl)
+            return
+        try:
+            await self.client.set(key, json.dumps(headers).encode() + b"\n" + body, ex=round(ttl))
+        except RedisError as err:
+            print(err)
+
+    def clear(self):
+        self.local.clear()
+        self.generations.clear()
+        self.bumped.clear()
+
+    def stats(self) -> dict:
+        """
+        Return hit/miss counters per route
+
+        :return: dict: Cache statistics
+        """
+        routes = {}
+        for route in sorted(set(self.hits) | set(self.misses)):
+            hits, misses = self.hits[route], self.misses[route]
+            routes[route] = {"hits": hits, "misses": misses, "hit_ratio": hits / (hits + misses)}
+        return {"backend": "memory" if self.client is None else "redis", "size": len(self.local), "routes": routes}
+
+
+response_cache = ResponseCache(redis_client if config.RESPONSE_CACHE_BACKEND == 'redis' else None,
+                               config.RESPONSE_CACHE_TTL, config.RESPONSE_CACHE_JITTER,
+                               LRUCache(config.RESPONSE_CACHE_SIZE, config.RESPONSE_CACHE_TTL),
+                               config.RESPONSE_CACHE_MAX_BYTES, config.DB_READ_YOUR_WRITES_WINDOW)
@@ -0,0 +1,63 @@
+import json
+import operator
+from datetime import date
+
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional, e.g. pip install fastapi[all]
+    orjson = None
+
+
+def dumps(value) -> bytes:
+    """
+    Encode plain lists, dicts, strings, numbers and dates to compact JSON, with orjson when it is installed
+
+    :param value: Value to encode
+    :return: bytes: JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False,
+                      default=lambda obj: obj.isoformat() if isinstance(obj, date) else str(obj)).encode()
+
+
+class Renderer:
+    """
+    Render repository results as the JSON of a response model
+
+    The safe path validates every row through a precompiled TypeAdapter. The fast path copies the model fields
+    straight from the rows into dicts and encodes them without validation, the rows come from our own database
+    and already have the right types. Both produce the same bytes.
+
+    :param model: type[BaseModel]: Response model of one item
+    :param many: bool: Render a list of items
+    :param key: str: Wrap the list in an object under key, e.g. {"contacts": [...]}
+    """
+
+    def __init__(self, model: type[BaseModel], many: bool = False, key: str | None = None):
+        self.fields = tuple(model.model_fields)
+        self.many = many or key is not None
+        self.key = key
+        annotation = list[model] if self.many else model
+        self.adapter = TypeAdapter(dict[str, annotation] if key else annotation)
+        getter = operator.attrgetter(*self.fields)
+        self._values = getter if len(self.fields) > 1 else lambda obj: (getter(obj),)
+
+    def record(self, obj) -> dict:
+        return dict(zip(self.fields, self._values(obj)))
+
+    def render(self, content, fast: bool = False) -> bytes:
+        """
+        Render content as JSON
+
+        :param content: Row, list of rows or for a keyed renderer {key: rows}
+        :param fast: bool: Skip validation and encode the rows directly
+        :return: bytes: JSON body
+        """
+        if not fast:
+            return self.adapter.dump_json(self.adapter.validate_python(content, from_attributes=True))
+        rows = content[self.key] if self.key else content
+        value = [self.record(row) for row in rows] if self.many else self.record(rows)
+        return dumps({self.key: value} if self.key else value)
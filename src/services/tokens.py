@@ -0,0 +1,137 @@
+import secrets
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+from src.services.cache import LRUCache, redis_client
+
+
+class InvalidRefreshToken(Exception):
+    """
+    Raised when a refresh token belongs to an unknown, expired or revoked family
+    """
+
+
+class RefreshTokenReused(InvalidRefreshToken):
+    """
+    Raised when an already rotated refresh token is presented again, the whole family is revoked
+    """
+
+
+class TokenStoreUnavailable(Exception):
+    """
+    Raised when the refresh token store cannot be reached, no refresh token can be issued or rotated
+    """
+
+
+class MemoryRefreshTokenStore:
+    """
+    In-memory refresh token store for tests and single workers
+
+    Every login starts a family, every refresh rotates the family to a new token id.
+    Presenting a token id that is not the current one of its family revokes the family.
+
+    :param ttl: int: Lifetime of a family after its last rotation in seconds
+    :param size: int: Maximum number of families kept, expired and least recently used families are dropped
+    """
+
+    def __init__(self, ttl: int = config.REFRESH_TOKEN_TTL, size: int = config.REFRESH_TOKEN_MEMORY_SIZE):
+        self.ttl = ttl
+        self._families = LRUCache(size, ttl)
+
+    async def start(self) -> tuple[str, str]:
+        """
+        Start a new token family
+
+        :return: tuple[str, str]: Family id and id of its first token
+        """
+        family, jti = secrets.token_urlsafe(16), secrets.token_urlsafe(16)
+        # families of logins that are never refreshed expire here instead of staying until evicted
+        self._families.prune()
+        self._families.set(family, jti)
+        return family, jti
+
+    async def rotate(self, family: str, jti: str) -> str:
+        """
+        Replace the current token id of a family
+
+        :param family: str: Family id from the token
+        :param jti: str: Token id from the token
+        :return: str: Id of the new token
+        """
+        current = self._families.get(family)
+        if current is None:
+            raise InvalidRefreshToken()
+        if current != jti:
+            self._families.pop(family)
+            raise RefreshTokenReused()
+        new_jti = secrets.token_urlsafe(16)
+        self._families.set(family, new_jti)
+        return new_jti
+
+    async def revoke(self, family: str):
+        self._families.pop(family)
+
+
+class RedisRefreshTokenStore(MemoryRefreshTokenStore):
+    """
+    Refresh token store shared by all workers, one Redis key per family
+
+    :param client: redis.Redis: Async Redis client
+    :param ttl: int: Lifetime of a family after its last rotation in seconds
+    """
+
+    prefix = "refresh:"
+    rotate_script = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    return 0
+end
+if current == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+redis.call('DEL', KEYS[1])
+return -1
+"""
+
+    def __init__(self, client: redis.Redis, ttl: int = config.REFRESH_TOKEN_TTL):
+        self.ttl = ttl
+        self.client = client
+        self._rotate = client.register_script(self.rotate_script)
+
+    async def start(self) -> tuple[str, str]:
+        family, jti = secrets.token_urlsafe(16), secrets.token_urlsafe(16)
+        try:
+            await self.client.set(self.prefix + family, jti, ex=self.ttl)
+        except RedisError as err:
+            print(err)
+            raise TokenStoreUnavailable() from err
+        return family, jti
+
+    async def rotate(self, family: str, jti: str) -> str:
+        new_jti = secrets.token_urlsafe(16)
+        try:
+            result = await self._rotate(keys=[self.prefix + family], args=[jti, new_jti, self.ttl])
+        except RedisError as err:
+            print(err)
+            raise TokenStoreUnavailable() from err
+        if result == 0:
+            raise InvalidRefreshToken()
+        if result == -1:
+            raise RefreshTokenReused()
+        return new_jti
+
+    async def revoke(self, family: str):
+        try:
+            await self.client.delete(self.prefix + family)
+        except RedisError as err:
+            print(err)
+            raise TokenStoreUnavailable() from err
+
+
+if config.REFRESH_TOKEN_STORE == 'memory':
+    refresh_token_store = MemoryRefreshTokenStore()
+else:
+    refresh_token_store = RedisRefreshTokenStore(redis_client)
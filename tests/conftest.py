@@ -10,8 +10,13 @@ from sqlalchemy.pool import StaticPool
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from main import app
 from src.entity.models import Base, User
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.services.auth import auth_service
+from src.services.cache import user_cache
+from src.services.invalidation import LocalInvalidationBus
+from src.services.rate_limit import rate_limiter
+from src.services.response_cache import response_cache
+from src.services.tokens import MemoryRefreshTokenStore
 
 SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
@@ -20,12 +25,19 @@ engine = create_async_engine(
 )
 TestingSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
+user_cache.client = None
+user_cache.attach(LocalInvalidationBus())
+auth_service.refresh_tokens = MemoryRefreshTokenStore()
+response_cache.client = None
+rate_limiter.client = None
+
 test_user = {"username": "deadpool", "email": "deadpool@example.com", "password": "12345678"}
 
 
 @pytest.fixture(scope="module", autouse=True)
 def init_models_wrap():
     async def init_models():
+        response_cache.clear()
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.drop_all)
             await conn.run_sync(Base.metadata.create_all)
@@ -54,6 +66,7 @@ def client():
             await session.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
 
     yield TestClient(app)
 
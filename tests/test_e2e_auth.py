@@ -1,9 +1,14 @@
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, Mock
 import pytest
 from sqlalchemy import select
 
+from src.commands.password_cost import cost_distribution
+from src.conf.config import config
 from src.conf.messages import *
 from src.entity.models import User
+from src.services.auth import auth_service
+from src.services.passwords import build_context, get_rounds
+from src.services.tokens import TokenStoreUnavailable
 from tests.conftest import TestingSessionLocal
 
 user_data = {"username": "agent007", "email": "agent007@example.com", "password": "12345678"}
@@ -55,6 +60,15 @@ async def test_login(client):
     assert "token_type" in data
 
 
+def test_login_token_store_unavailable(client, monkeypatch):
+    monkeypatch.setattr(auth_service.refresh_tokens, "start", AsyncMock(side_effect=TokenStoreUnavailable()))
+    response = client.post("api/auth/login", data={"username": user_data.get("email"),
+                                                   "password": user_data.get("password")})
+    assert response.status_code == 503, response.text
+    assert response.json()["detail"] == TOKEN_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "5"
+
+
 def test_wrong_password(client):
     response = client.post("api/auth/login", data={"username": user_data.get("email"),
                                                    "password": "password"})
@@ -75,4 +89,48 @@ def test_validation_error_login(client):
     response = client.post("api/auth/login", data={"password": user_data.get("password")})
     assert response.status_code == 422, response.text
     data = response.json()
-    assert "detail" in data
\ No newline at end of file
+    assert "detail" in data
+
+def test_login_password_service_busy(client, monkeypatch):
+    monkeypatch.setattr("src.services.auth.auth_service.password_hasher.max_pending", 0)
+    response = client.post("api/auth/login", data={"username": user_data.get("email"),
+                                                   "password": user_data.get("password")})
+    assert response.status_code == 503, response.text
+    assert response.headers["Retry-After"] == "1"
+    data = response.json()
+    assert data["detail"] == PASSWORD_SERVICE_BUSY
+
+
+def test_refresh_token_rotation(client):
+    response = client.post("api/auth/login", data={"username": user_data.get("email"),
+                                                   "password": user_data.get("password")})
+    assert response.status_code == 200, response.text
+    first = response.json()["refresh_token"]
+
+    response = client.get("api/auth/refresh_token", headers={"Authorization": f"Bearer {first}"})
+    assert response.status_code == 200, response.text
+    second = response.json()["refresh_token"]
+    assert second != first
+
+    response = client.get("api/auth/refresh_token", headers={"Authorization": f"Bearer {first}"})
+    assert response.status_code == 401, response.text
+
+    response = client.get("api/auth/refresh_token", headers={"Authorization": f"Bearer {second}"})
+    assert response.status_code == 401, response.text
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_password_cost(client):
+    async with TestingSessionLocal() as session:
+        current_user = await session.execute(select(User).where(User.email == user_data.get("email")))
+        current_user = current_user.scalar_one()
+        current_user.password = build_context(4).hash(user_data.get("password"))
+        await session.commit()
+    response = client.post("api/auth/login", data={"username": user_data.get("email"),
+                                                   "password": user_data.get("password")})
+    assert response.status_code == 200, response.text
+    async with TestingSessionLocal() as session:
+        current_user = await session.execute(select(User).where(User.email == user_data.get("email")))
+        assert get_rounds(current_user.scalar_one().password) == config.BCRYPT_ROUNDS
+        distribution = await cost_distribution(session)
+        assert distribution[config.BCRYPT_ROUNDS] == 2
@@ -1,15 +1,340 @@
-from unittest.mock import Mock, patch
+import csv
+import io
+import json
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
 import pytest
+from sqlalchemy import func, select, update
+
+from src.commands.contact_counts import reconcile_counts
+from src.entity.models import Contact, ContactCount
+from src.routes.contacts import cached_response, contact_list_renderer
 from src.services.auth import auth_service
+from src.services.conditional import make_etag
+from src.services.response_cache import response_cache
+from tests.conftest import TestingSessionLocal
+
+
+metrics_headers = {"Authorization": "Bearer metrics-secret"}
+
+
+@pytest.fixture(autouse=True)
+def metrics_token(monkeypatch):
+    monkeypatch.setattr("src.routes.metrics.config.METRICS_TOKEN", "metrics-secret")
+
+
+def test_metrics_need_token(client, get_token, monkeypatch):
+    response = client.get("api/metrics/")
+    assert response.status_code == 401, response.text
+    response = client.get("api/metrics/", headers={"Authorization": f"Bearer {get_token}"})
+    assert response.status_code == 401, response.text
+    monkeypatch.setattr("src.routes.metrics.config.METRICS_TOKEN", "")
+    response = client.get("api/metrics/", headers=metrics_headers)
+    assert response.status_code == 404, response.text
 
 
 def test_get_contacts(client, get_token):
-    with patch.object(auth_service, 'cache') as redis_mock:
-        redis_mock.get.return_value = None
-        token = get_token
-        response = client.get("api/contacts", headers={"Authorization": f"Bearer {token}"})
+    token = get_token
+    response = client.get("api/contacts", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert len(data) == 0
+
+
+def test_get_contacts_cached_user(client, get_token):
+    with patch("src.repository.users.get_user_by_email") as get_user_mock:
+        response = client.get("api/contacts", headers={"Authorization": f"Bearer {get_token}"})
+        assert response.status_code == 200, response.text
+        get_user_mock.assert_not_called()
+
+
+def test_token_cache_hits(client, get_token):
+    hits = auth_service.token_cache.hits
+    for _ in range(2):
+        response = client.get("api/contacts", headers={"Authorization": f"Bearer {get_token}"})
+        assert response.status_code == 200, response.text
+    assert auth_service.token_cache.hits >= hits + 1
+    response = client.get("api/metrics/", headers=metrics_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["token_cache"]["hits"] == auth_service.token_cache.hits
+
+
+def test_get_contacts_cursor_pagination(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    for i in range(25):
+        response = client.post("api/contacts/", headers=headers,
+                               json={"first_name": f"name{i}", "second_name": "test", "email": f"test{i}@example.com",
+                                     "birthday": "2000-01-01", "add_info": "test", "user_id": 1})
+        assert response.status_code == 201, response.text
+
+    pages = []
+    cursor = None
+    while True:
+        params = {"limit": 10}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("api/contacts/", headers=headers, params=params)
         assert response.status_code == 200, response.text
-        data = response.json()
-        assert len(data) == 0
+        pages.append([contact["first_name"] for contact in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert sum(pages, []) == [f"name{i}" for i in range(25)]
+
+    response = client.get("api/contacts/", headers=headers, params={"limit": 10, "offset": 20})
+    assert [contact["first_name"] for contact in response.json()] == pages[2]
+
+
+def test_get_contacts_invalid_cursor(client, get_token):
+    response = client.get("api/contacts/", headers={"Authorization": f"Bearer {get_token}"},
+                          params={"cursor": "not a cursor"})
+    assert response.status_code == 400, response.text
+
+
+def test_get_birthday_across_month_and_year_end(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    for name, birthday in (("winter", "1990-12-30"), ("newyear", "1991-01-03"), ("february", "1992-02-02"),
+                           ("summer", "1993-06-01")):
+        response = client.post("api/contacts/", headers=headers,
+                               json={"first_name": name, "second_name": "test", "email": f"{name}@example.com",
+                                     "birthday": birthday, "add_info": "test", "user_id": 1})
+        assert response.status_code == 201, response.text
+
+    with patch("src.repository.contacts.date") as date_mock:
+        date_mock.today.return_value = date(2026, 12, 28)
+        response = client.get("api/contacts/birthday/", headers=headers, params={"days": 10})
+        assert response.status_code == 200, response.text
+        names = [contact["first_name"] for contact in response.json()["contacts"]]
+        assert names.index("winter") < names.index("newyear")
+        assert "february" not in names and "summer" not in names
+
+        date_mock.today.return_value = date(2027, 1, 30)
+        response = client.get("api/contacts/birthday/", headers=headers)
+        names = [contact["first_name"] for contact in response.json()["contacts"]]
+        assert names == ["february"]
+
+
+def test_fuzzy_search(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    for name in ("John", "Jonathan", "Joanna"):
+        response = client.post("api/contacts/", headers=headers,
+                               json={"first_name": name, "second_name": "Fuzzy", "email": f"{name}@example.com",
+                                     "birthday": "1990-05-05", "add_info": "test", "user_id": 1})
+        assert response.status_code == 201, response.text
+
+    response = client.get("api/contacts/search/", headers=headers, params={"q": "Jon", "limit": 2})
+    assert response.status_code == 200, response.text
+    names = [contact["first_name"] for contact in response.json()]
+    assert names == ["Jonathan", "John"]
+
+    response = client.get("api/contacts/search/", headers=headers, params={"q": "zzzz"})
+    assert response.json() == []
+
+
+def test_import_contacts_csv(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    rows = ["first_name,second_name,email,birthday,add_info"]
+    rows += [f"import{i},csv,import{i}@example.com,1980-03-0{i % 9 + 1},info" for i in range(30)]
+    rows += ["broken,csv,broken@example.com,not a date,info", ",csv,empty@example.com,1980-01-01,info"]
+    response = client.post("api/contacts/import", headers=headers,
+                           files={"file": ("contacts.csv", "\n".join(rows).encode(), "text/csv")})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["inserted"] == 30
+    assert data["failed"] == 2
+    assert [error["row"] for error in data["errors"]] == [31, 32]
+
+    response = client.get("api/contacts/search/", headers=headers, params={"second_name": "csv"})
+    assert len(response.json()) == 30
+
+
+def test_import_contacts_ndjson(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    lines = ['{"first_name": "nd", "second_name": "json", "email": "nd@example.com", "birthday": "1970-07-07", '
+             '"add_info": "info", "user_id": 999}', "", "{not json", "[1, 2]"]
+    response = client.post("api/contacts/import", headers=headers,
+                           files={"file": ("contacts.ndjson", "\n".join(lines).encode(), "application/x-ndjson")})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["inserted"] == 1
+    assert [error["row"] for error in data["errors"]] == [3, 4]
+    response = client.get("api/contacts/search/", headers=headers, params={"second_name": "json"})
+    assert response.json()[0]["user_id"] == 1
+
+
+def test_import_contacts_unsupported_format(client, get_token):
+    response = client.post("api/contacts/import", headers={"Authorization": f"Bearer {get_token}"},
+                           files={"file": ("contacts.xlsx", b"data", "application/octet-stream")})
+    assert response.status_code == 415, response.text
+
+
+def test_export_contacts(client, get_token, monkeypatch):
+    monkeypatch.setattr("src.routes.contacts.config.EXPORT_BATCH_SIZE", 7)
+    headers = {"Authorization": f"Bearer {get_token}"}
+    total = len(client.get("api/contacts/", headers=headers, params={"limit": 500}).json())
+
+    response = client.get("api/contacts/export/", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == total
+    assert set(lines[0]) == {"first_name", "second_name", "email", "birthday", "add_info", "user_id"}
+
+    response = client.get("api/contacts/export/", headers=headers, params={"format": "csv"})
+    assert response.status_code == 200, response.text
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == total
+    assert rows[0]["first_name"] == lines[0]["first_name"]
+
+
+def test_batch_contacts(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    contact = {"second_name": "batch", "email": "batch@example.com", "birthday": "1990-03-15", "add_info": "batch",
+               "user_id": 1}
+    response = client.post("api/contacts/batch/", headers=headers,
+                           json={"upsert": [{**contact, "first_name": f"upsert{i}", "external_id": f"ext-{i}"}
+                                            for i in range(3)]})
+    assert response.status_code == 200, response.text
+    upserted = response.json()["upserted"]
+    assert [row["external_id"] for row in upserted] == ["ext-0", "ext-1", "ext-2"]
+    ids = [row["id"] for row in upserted]
+
+    response = client.post("api/contacts/batch/", headers=headers, json={
+        "upsert": [{**contact, "first_name": "renamed", "external_id": "ext-0"}],
+        "update": [{**contact, "first_name": "updated", "birthday": "1990-12-31", "id": ids[1]},
+                   {**contact, "first_name": "missing", "id": 10 ** 6}],
+        "delete": [ids[2], 10 ** 6],
+    })
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [(row["id"], row["first_name"]) for row in data["upserted"]] == [(ids[0], "renamed")]
+    assert [(row["id"], row["first_name"]) for row in data["updated"]] == [(ids[1], "updated")]
+    assert data["deleted"] == [ids[2]]
+
+    response = client.get(f"api/contacts/{ids[2]}", headers=headers)
+    assert response.status_code == 404, response.text
+    response = client.get("api/contacts/birthday/", headers=headers, params={"days": 366})
+    assert "updated" in [row["first_name"] for row in response.json()["contacts"]]
+
+
+def test_batch_contacts_too_many(client, get_token):
+    response = client.post("api/contacts/batch/", headers={"Authorization": f"Bearer {get_token}"},
+                           json={"delete": list(range(1001))})
+    assert response.status_code == 422, response.text
+
+
+def test_response_cache(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    first = client.get("api/contacts/", headers=headers, params={"limit": 500})
+    assert first.status_code == 200, first.text
+    with patch("src.repository.contacts.get_contacts") as get_contacts_mock:
+        second = client.get("api/contacts/", headers=headers, params={"limit": 500})
+        get_contacts_mock.assert_not_called()
+    assert second.json() == first.json()
+
+    response = client.post("api/contacts/", headers=headers,
+                           json={"first_name": "cached", "second_name": "test", "email": "cached@example.com",
+                                 "birthday": "2000-01-01", "add_info": "test", "user_id": 1})
+    assert response.status_code == 201, response.text
+    third = client.get("api/contacts/", headers=headers, params={"limit": 500})
+    assert len(third.json()) == len(first.json()) + 1
+    stats = client.get("api/metrics/", headers=metrics_headers).json()["response_cache"]["routes"]["get_contacts"]
+    assert stats["hits"] >= 1
+
+
+def test_conditional_get(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.get("api/contacts/", headers=headers, params={"limit": 500})
+    etag = response.headers["ETag"]
+    assert "Last-Modified" not in response.headers
+    response = client.get("api/contacts/", params={"limit": 500},
+                          headers={**headers, "If-Modified-Since": "Sun, 18 Oct 2099 10:00:00 GMT"})
+    assert response.status_code == 200, response.text
+
+    response = client.get("api/contacts/", headers={**headers, "If-None-Match": etag}, params={"limit": 500})
+    assert response.status_code == 304, response.text
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    contact = client.get("api/contacts/search/", headers=headers, params={"first_name": "cached"}).json()[0]
+    contact_id = contact.pop("id")
+    response = client.get(f"api/contacts/{contact_id}", headers=headers)
+    assert response.status_code == 200, response.text
+    last_modified = response.headers["Last-Modified"]
+    response = client.get(f"api/contacts/{contact_id}", headers={**headers, "If-Modified-Since": last_modified})
+    assert response.status_code == 304, response.text
+
+    response = client.put(f"api/contacts/{contact_id}", headers=headers,
+                          json={**contact, "first_name": "changed", "completed": True})
+    assert response.status_code == 200, response.text
+    response = client.get("api/contacts/", headers={**headers, "If-None-Match": etag}, params={"limit": 500})
+    assert response.status_code == 200, response.text
+    assert response.headers["ETag"] != etag
+
+    etag = response.headers["ETag"]
+    with patch("src.routes.contacts.response_cache.get") as get_mock, \
+            patch("src.repository.contacts.get_contacts") as get_contacts_mock:
+        response = client.get("api/contacts/", headers={**headers, "If-None-Match": etag}, params={"limit": 500})
+        assert response.status_code == 304, response.text
+        assert response.headers["ETag"] == etag
+        get_mock.assert_not_called()
+        get_contacts_mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_cached_response_etag():
+    user = SimpleNamespace(id=1000)
+    load = AsyncMock(return_value=([], {}))
+    request = SimpleNamespace(headers={})
+    response = await cached_response(request, "test", {}, SimpleNamespace(info={}), user, contact_list_renderer,
+                                     load)
+    assert response.headers["ETag"] == make_etag(response.body)
+
+    await response_cache.bump(user.id)
+    response = await cached_response(request, "test", {}, SimpleNamespace(info={}), user, contact_list_renderer,
+                                     load)
+    etag = response.headers["ETag"]
+    assert etag != make_etag(response.body)
+    load.reset_mock()
+    response = await cached_response(SimpleNamespace(headers={"if-none-match": etag}), "test", {},
+                                     SimpleNamespace(info={}), user, contact_list_renderer, load)
+    assert response.status_code == 304
+    load.assert_not_awaited()
+
+    response = await cached_response(request, "other", {}, SimpleNamespace(info={"replica": True}), user,
+                                     contact_list_renderer, load)
+    assert response.headers["ETag"] == make_etag(response.body)
+
+
+def test_fast_responses(client, get_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    params = {"limit": 500}
+    expected = client.get("api/contacts/", headers=headers, params=params).json()
+    monkeypatch.setattr("src.routes.contacts.config.FAST_RESPONSES", True)
+    with patch("src.routes.contacts.response_cache.get", AsyncMock(return_value=None)):
+        response = client.get("api/contacts/", headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    assert response.json() == expected
+
 
+@pytest.mark.asyncio
+async def test_total_count_and_reconcile(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.get("api/contacts/", headers=headers, params={"limit": 10})
+    total = int(response.headers["X-Total-Count"])
+    async with TestingSessionLocal() as session:
+        assert total == (await session.execute(select(func.count()).select_from(Contact))).scalar_one()
+        await session.execute(update(ContactCount).values(count=ContactCount.count + 5))
+        await session.commit()
+        assert await reconcile_counts(session, dry_run=True) == [(1, total + 5, total)]
+        assert await reconcile_counts(session) == [(1, total + 5, total)]
+        assert await reconcile_counts(session) == []
 
+    response = client.post("api/contacts/batch/", headers=headers, json={
+        "upsert": [{"first_name": "counted", "second_name": "test", "email": "counted@example.com",
+                    "birthday": "2000-01-01", "add_info": "test", "user_id": 1, "external_id": "counted"}]})
+    assert response.status_code == 200, response.text
+    response = client.get("api/contacts/", headers=headers, params={"limit": 10})
+    assert int(response.headers["X-Total-Count"]) == total + 1
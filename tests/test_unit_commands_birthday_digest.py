@@ -0,0 +1,53 @@
+import unittest
+from collections import namedtuple
+from datetime import date
+from unittest.mock import AsyncMock, patch
+
+from src.commands.birthday_digest import collect_digests, next_birthday, send_digests
+
+BirthdayRow = namedtuple("BirthdayRow", "user_id email username first_name second_name birthday")
+
+
+async def partitions(*batches):
+    for batch in batches:
+        yield batch
+
+
+class TestAsyncBirthdayDigest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.today = date(2026, 12, 30)
+        self.rows = [
+            BirthdayRow(1, "one@example.com", "one", "a", "a", date(1990, 12, 31)),
+            BirthdayRow(1, "one@example.com", "one", "b", "b", date(1991, 1, 2)),
+            BirthdayRow(2, "two@example.com", "two", "c", "c", date(1992, 12, 30)),
+            BirthdayRow(3, "three@example.com", "three", "d", "d", date(1993, 1, 1)),
+        ]
+
+    def test_next_birthday(self):
+        self.assertEqual(next_birthday(date(1990, 12, 31), self.today), date(2026, 12, 31))
+        self.assertEqual(next_birthday(date(1990, 1, 2), self.today), date(2027, 1, 2))
+        self.assertEqual(next_birthday(date(2000, 2, 29), date(2027, 2, 1)), date(2027, 3, 1))
+
+    async def test_collect_digests_groups_across_partitions(self):
+        batches = [batch async for batch in collect_digests(partitions(self.rows[:1], self.rows[1:]), self.today, 2)]
+        self.assertEqual([[digest["user_id"] for digest in batch] for batch in batches], [[1, 2], [3]])
+        first = batches[0][0]
+        self.assertEqual(first["email"], "one@example.com")
+        self.assertEqual([(contact["date"], contact["days"]) for contact in first["contacts"]],
+                         [("2026-12-31", 1), ("2027-01-02", 3)])
+
+    async def test_send_digests(self):
+        with patch("src.commands.birthday_digest.stream_upcoming_birthdays",
+                   return_value=partitions(self.rows)) as stream_mock, \
+                patch("src.commands.birthday_digest.send_birthday_digests", AsyncMock(return_value=2)) as send_mock:
+            stats = await send_digests(AsyncMock(), 7, 2, today=self.today)
+        stream_mock.assert_called_once()
+        self.assertEqual(send_mock.await_count, 2)
+        self.assertEqual((stats["users"], stats["contacts"], stats["queued"]), (3, 4, 4))
+
+    async def test_send_digests_dry_run(self):
+        with patch("src.commands.birthday_digest.stream_upcoming_birthdays", return_value=partitions(self.rows)), \
+                patch("src.commands.birthday_digest.send_birthday_digests", AsyncMock()) as send_mock:
+            stats = await send_digests(AsyncMock(), 7, 2, dry_run=True, today=self.today)
+        send_mock.assert_not_awaited()
+        self.assertEqual((stats["users"], stats["queued"]), (3, 0))
@@ -0,0 +1,28 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.commands.contact_counts import recount_user
+
+
+class TestAsyncRecountUser(unittest.IsolatedAsyncioTestCase):
+    async def test_locks_counter_before_counting(self):
+        session = AsyncMock(spec=AsyncSession)
+        session.get_bind = MagicMock()
+        session.get_bind.return_value.dialect.name = "postgresql"
+        counted = MagicMock()
+        counted.scalar_one.return_value = 4
+        session.execute.return_value = counted
+
+        with patch("src.commands.contact_counts.response_cache.bump") as bump_mock:
+            self.assertEqual(await recount_user(7, session), 4)
+        bump_mock.assert_awaited_once_with(7)
+        statements = [str(call.args[0].compile(dialect=postgresql.dialect()))
+                      for call in session.execute.await_args_list]
+        self.assertIn("ON CONFLICT (user_id) DO NOTHING", statements[0])
+        self.assertTrue(statements[1].endswith("FOR UPDATE"))
+        self.assertIn("count(*)", statements[2])
+        self.assertTrue(statements[3].startswith("UPDATE contact_counts SET count="))
+        session.commit.assert_awaited_once()
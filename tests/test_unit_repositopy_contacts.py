@@ -2,10 +2,11 @@ import unittest
 from unittest.mock import MagicMock, AsyncMock
 from datetime import date, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.schemas.contact import ContactSchema, ContactUpdateSchema
+from src.schemas.contact import ContactSchema, ContactUpdateSchema, ContactBatchSchema
 from src.entity.models import Contact, User
 from src.repository.contacts import get_contacts, get_contact, create_contact, update_contact, delete_contact, \
-    search_contacts, get_contacts_birthday
+    search_contacts, get_contacts_birthday, encode_cursor, decode_cursor, trigram_similarity, \
+    batch_contacts, import_contacts
 
 
 class TestAsyncContactRepository(unittest.IsolatedAsyncioTestCase):
@@ -22,18 +23,39 @@ class TestAsyncContactRepository(unittest.IsolatedAsyncioTestCase):
             Contact(id=1, first_name="test", second_name="test", email="test", birthday="test"),
             Contact(id=2, first_name="test", second_name="test", email="test", birthday="test")]
         mocked_contacts = MagicMock()
-        mocked_contacts.scalars.return_value.all.return_value = contacts
+        mocked_contacts.all.return_value = contacts
         self.session.execute.return_value = mocked_contacts
         result = await get_contacts(limit, offset, self.session, self.user)
         self.assertEqual(result, contacts)  # assert that result is equal to contacts
 
+    async def test_import_contacts_copy_in_transaction(self):
+        self.session.get_bind = MagicMock()
+        self.session.get_bind.return_value.dialect.driver = "asyncpg"
+        self.session.get_bind.return_value.dialect.name = "postgresql"
+        raw = MagicMock()
+        raw.driver_connection.copy_records_to_table = AsyncMock(
+            side_effect=lambda *args, **kwargs: self.assertEqual(self.session.execute.await_count, 1))
+        self.session.connection.return_value.get_raw_connection = AsyncMock(return_value=raw)
+        body = ContactSchema(first_name="a", second_name="b", email="c", birthday=date(1990, 1, 1), add_info="d",
+                             user_id=1)
+
+        async def batches():
+            yield [body, body]
+            yield [body]
+
+        result = await import_contacts(batches(), self.session, self.user)
+        self.assertEqual(result, 3)
+        self.assertEqual(str(self.session.execute.await_args_list[0].args[0]), "SELECT 1")
+        self.assertEqual(raw.driver_connection.copy_records_to_table.await_count, 2)
+        self.session.commit.assert_awaited_once()
+
     async def test_get_contact(self):
         contact_id = 1
         contact = [
             Contact(id=1, first_name="test", second_name="test", email="test", birthday="test"),
         ]
         mocked_contact = MagicMock()
-        mocked_contact.scalar_one_or_none.return_value = contact
+        mocked_contact.one_or_none.return_value = contact
         self.session.execute.return_value = mocked_contact
         result = await get_contact(contact_id, self.session, self.user)
         self.assertEqual(result, contact)  # assert that result is equal to contact
@@ -42,7 +64,9 @@ class TestAsyncContactRepository(unittest.IsolatedAsyncioTestCase):
         body = ContactSchema(first_name="test", second_name="test", email="test",
                              birthday=date(2000, 1, 1),
                              add_info="test", user_id=1)
-
+        mocked_contact = MagicMock()
+        mocked_contact.one.return_value = MagicMock(_mapping={"id": 1, **body.model_dump()})
+        self.session.execute.return_value = mocked_contact
         result = await create_contact(body, self.session, self.user)
         self.assertIsInstance(result, Contact)
         self.assertEqual(result.first_name, body.first_name)
@@ -50,6 +74,9 @@ class TestAsyncContactRepository(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.email, body.email)
         self.assertEqual(result.add_info, body.add_info)
         self.assertEqual(result.birthday, body.birthday)
+        # the insert and the contact count upsert, no refresh
+        self.assertEqual(self.session.execute.await_count, 2)
+        self.session.refresh.assert_not_called()
 
     async def test_update_contact(self):
         contact_id = 1
@@ -57,9 +84,8 @@ class TestAsyncContactRepository(unittest.IsolatedAsyncioTestCase):
                                    birthday=date(2000, 1, 1),
                                    add_info="test", user_id=1, completed=True)
         mocked_contact = MagicMock()
-        mocked_contact.scalar_one_or_none.return_value = Contact(id=1, first_name="test", second_name="test",
-                                                                 email="test", birthday=date(2000, 1, 1),
-                                                                 add_info="test", user=self.user)
+        mocked_contact.one_or_none.return_value = MagicMock(_mapping={
+            "id": 1, **body.model_dump(exclude={"completed"})})
         self.session.execute.return_value = mocked_contact
         result = await update_contact(contact_id, body, self.session, self.user)
         self.assertIsInstance(result, Contact)
@@ -68,16 +94,30 @@ class TestAsyncContactRepository(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.email, body.email)
         self.assertEqual(result.add_info, body.add_info)
         self.assertEqual(result.birthday, body.birthday)
+        self.session.execute.assert_awaited_once()
+        self.session.refresh.assert_not_called()
+
+    async def test_update_contact_not_found(self):
+        body = ContactUpdateSchema(first_name="test", second_name="test", email="test",
+                                   birthday=date(2000, 1, 1),
+                                   add_info="test", user_id=1, completed=True)
+        mocked_contact = MagicMock()
+        mocked_contact.one_or_none.return_value = None
+        self.session.execute.return_value = mocked_contact
+        result = await update_contact(1, body, self.session, self.user)
+        self.assertIsNone(result)
+        self.session.commit.assert_not_called()
 
     async def test_delete_contact(self):
         contact_id = 1
         mocked_contact = MagicMock()
-        mocked_contact.scalar_one_or_none.return_value = Contact(id=1, first_name="test", second_name="test",
-                                                                 email="test", birthday=date(2000, 1, 1),
-                                                                 add_info="test", user=self.user)
+        mocked_contact.one_or_none.return_value = MagicMock(_mapping={
+            "id": 1, "first_name": "test", "second_name": "test", "email": "test", "birthday": date(2000, 1, 1),
+            "add_info": "test", "user_id": 1})
         self.session.execute.return_value = mocked_contact
         result = await delete_contact(contact_id, self.session, self.user)
         self.assertIsInstance(result, Contact)
+        self.assertEqual(result.id, contact_id)
 
     async def test_search_contact(self):
         search_text = "test"
@@ -87,7 +127,7 @@ class TestAsyncContactRepository(unittest.IsolatedAsyncioTestCase):
 
         matchting_contacts = [contact1]
         mocked_contacts = MagicMock()
-        mocked_contacts.scalars.return_value.all.return_value = matchting_contacts
+        mocked_contacts.all.return_value = matchting_contacts
         self.session.execute.return_value = mocked_contacts
         result = await search_contacts(search_text, search_text, search_text, self.session, self.user)
         self.assertEqual(result, matchting_contacts)
@@ -105,7 +145,31 @@ class TestAsyncContactRepository(unittest.IsolatedAsyncioTestCase):
 
         matchting_contacts = [contact2, contact3]
         mocked_contacts = MagicMock()
-        mocked_contacts.scalars.return_value.all.return_value = matchting_contacts
+        mocked_contacts.all.return_value = matchting_contacts
         self.session.execute.return_value = mocked_contacts
         result = await get_contacts_birthday(self.session, self.user)
         self.assertEqual(result, matchting_contacts)
+
+    async def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(42)), 42)
+        with self.assertRaises(ValueError):
+            decode_cursor("garbage")
+
+    async def test_trigram_similarity(self):
+        self.assertEqual(trigram_similarity("John", "john"), 1.0)
+        self.assertGreater(trigram_similarity("Jon", "John"), trigram_similarity("Jon", "Joanna"))
+        self.assertEqual(trigram_similarity("", "John"), 0.0)
+
+    async def test_batch_contacts_empty(self):
+        result = await batch_contacts(ContactBatchSchema(), self.session, self.user)
+        self.assertEqual(result, {"updated": [], "upserted": [], "deleted": []})
+        self.session.execute.assert_not_called()
+        self.session.commit.assert_called_once()
+
+    async def test_get_contacts_selects_columns_only(self):
+        self.session.execute.return_value = MagicMock()
+        await get_contacts(10, 0, self.session, self.user)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertNotIn("users", str(stmt))
+        self.assertEqual([column.name for column in stmt.selected_columns],
+                         ["id", "first_name", "second_name", "email", "birthday", "add_info", "user_id", "updated_at"])
@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import MagicMock, AsyncMock
+from unittest.mock import MagicMock, AsyncMock, patch
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.schemas.user import UserSchema, UserResponse, TokenSchema, RequestEmail
 from src.entity.models import User
@@ -13,11 +13,15 @@ class TestAsyncUserRepository(unittest.IsolatedAsyncioTestCase):
 
     async def test_create_user(self):
         body = UserSchema(username="test", email="test", password="testtest")
+        mocked_user = MagicMock()
+        mocked_user.one.return_value = MagicMock(_mapping={"id": 1, **body.model_dump(), "confirmed": False})
+        self.session.execute.return_value = mocked_user
         result = await create_user(body, self.session)
         self.assertIsInstance(result, User)
         self.assertEqual(result.username, body.username)
         self.assertEqual(result.email, body.email)
         self.assertEqual(result.password, body.password)
+        self.session.refresh.assert_not_called()
 
     async def test_get_user_by_email(self):
         user = User(
@@ -39,23 +43,32 @@ class TestAsyncUserRepository(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(user.refresh_token, "token_test")
 
     async def test_confirmed_email(self):
+        await confirmed_email("test2", self.session)
+        self.session.execute.assert_awaited_once()
+        self.session.commit.assert_awaited_once()
+
+    async def test_update_avatar_url(self):
         user = User(
-            id=1, username="test2", password="testtest", email="test2", confirmed=True, avatar="test"
+            id=1, username="test2", password="testtest", email="test2", confirmed=True, avatar="avatar_test"
         )
         mocked_user = MagicMock()
-        mocked_user.scalar_one_or_none.return_value = user
+        mocked_user.one.return_value = MagicMock(_mapping={
+            "id": user.id, "username": user.username, "password": user.password, "email": user.email,
+            "confirmed": user.confirmed, "avatar": "new_avatar"})
         self.session.execute.return_value = mocked_user
-        user.confirmed = False
-        await confirmed_email(user.email, self.session)
-
-        self.assertEqual(user.confirmed, True)
+        result = await update_avatar_url(user.email, "new_avatar", self.session)
+        self.assertIsInstance(result, User)
+        self.assertEqual(result.avatar, "new_avatar")
+        self.session.execute.assert_awaited_once()
+        self.session.refresh.assert_not_called()
 
-    async def test_update_avatar_url(self):
+    async def test_confirmed_email_invalidates_cache(self):
         user = User(
-            id=1, username="test2", password="testtest", email="test2", confirmed=True, avatar="avatar_test"
+            id=1, username="test2", password="testtest", email="test2", confirmed=False, avatar="test"
         )
         mocked_user = MagicMock()
         mocked_user.scalar_one_or_none.return_value = user
         self.session.execute.return_value = mocked_user
-        await update_avatar_url(user.avatar, "avatar_test", self.session)
-        self.assertEqual(user.avatar, "avatar_test")
+        with patch("src.repository.users.user_cache.invalidate") as invalidate_mock:
+            await confirmed_email(user.email, self.session)
+        invalidate_mock.assert_awaited_once_with("test2")
@@ -0,0 +1,72 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock
+
+from PIL import Image
+
+from src.services.avatars import (AvatarPipeline, InvalidAvatar, LocalAvatarStorage, content_digest, resize_avatar,
+                                  url_digest)
+
+
+def make_image(color: str, size=(800, 600), fmt: str = "PNG") -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGBA" if fmt == "PNG" else "RGB", size, color).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class TestAvatarHelpers(unittest.TestCase):
+    def test_url_digest(self):
+        digest = content_digest(b"avatar")
+        self.assertEqual(url_digest(f"/static/avatars/1/{digest}.jpg"), digest)
+        self.assertEqual(url_digest(f"https://res.cloudinary.com/x/image/upload/c_fill/Web16/1/{digest}"), digest)
+        self.assertIsNone(url_digest("https://www.gravatar.com/avatar/abc"))
+        self.assertIsNone(url_digest(None))
+
+    def test_resize(self):
+        data, ext = resize_avatar(make_image("red"), 250)
+        self.assertEqual(ext, "jpg")
+        self.assertEqual(Image.open(io.BytesIO(data)).size, (250, 250))
+        data, _ = resize_avatar(make_image("blue", (4000, 3000), "JPEG"), 250)
+        self.assertEqual(Image.open(io.BytesIO(data)).size, (250, 250))
+
+    def test_rejects_non_images(self):
+        with self.assertRaises(InvalidAvatar):
+            resize_avatar(b"not an image", 250)
+        buffer = io.BytesIO()
+        Image.new("RGB", (10, 10)).save(buffer, "BMP")
+        with self.assertRaises(InvalidAvatar):
+            resize_avatar(buffer.getvalue(), 250)
+
+
+class TestAsyncAvatarPipeline(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = LocalAvatarStorage(self.tmp.name, "/static/avatars/")
+        self.pipeline = AvatarPipeline(self.storage, 250)
+        self.image = make_image("red")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def test_stores_resized_avatar(self):
+        url = await self.pipeline.update("1", self.image, "https://www.gravatar.com/avatar/abc")
+        digest = content_digest(self.image)
+        self.assertEqual(url, f"/static/avatars/1/{digest}.jpg")
+        stored = Image.open(Path(self.tmp.name) / "1" / f"{digest}.jpg")
+        self.assertEqual(stored.size, (250, 250))
+
+    async def test_replaces_previous_file(self):
+        first = await self.pipeline.update("1", self.image, None)
+        second = await self.pipeline.update("1", make_image("green"), first)
+        self.assertNotEqual(first, second)
+        self.assertEqual([path.name for path in (Path(self.tmp.name) / "1").iterdir()],
+                         [second.rsplit("/", 1)[1]])
+
+    async def test_skips_current_avatar(self):
+        self.storage.save = AsyncMock()
+        url = await self.pipeline.update("1", self.image, f"/static/avatars/1/{content_digest(self.image)}.jpg")
+        self.assertIsNone(url)
+        self.storage.save.assert_not_called()
+        self.assertEqual(self.pipeline.stats()["skipped"], 1)
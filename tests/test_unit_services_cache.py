@@ -0,0 +1,145 @@
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from src.entity.models import User
+from src.services.cache import LRUCache, UserCache, dump_user
+from src.services.invalidation import LocalInvalidationBus, RedisInvalidationBus
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def test_expires_entries(self):
+        cache = LRUCache(maxsize=2, ttl=10)
+        with patch("src.services.cache.time.monotonic", return_value=100):
+            cache.set("a", 1)
+        with patch("src.services.cache.time.monotonic", return_value=109):
+            self.assertEqual(cache.get("a"), 1)
+        with patch("src.services.cache.time.monotonic", return_value=110):
+            self.assertIsNone(cache.get("a"))
+
+
+class TestAsyncUserCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.user = User(id=1, username="test", email="test@example.com", password="hash", avatar=None,
+                         confirmed=True)
+        self.client = AsyncMock()
+        self.cache = UserCache(self.client, 300, LRUCache(10, 5))
+
+    async def test_set_writes_single_command(self):
+        await self.cache.set(self.user)
+        self.client.set.assert_awaited_once_with("user:test@example.com", json.dumps(dump_user(self.user),
+                                                                                     separators=(",", ":")),
+                                                 ex=300)
+
+    async def test_get_from_local_tier(self):
+        await self.cache.set(self.user)
+        result = await self.cache.get(self.user.email)
+        self.client.get.assert_not_awaited()
+        self.assertIsInstance(result, User)
+        self.assertEqual(result.id, 1)
+        self.assertEqual(result.confirmed, True)
+
+    async def test_get_from_redis(self):
+        self.client.get.return_value = json.dumps(dump_user(self.user)).encode()
+        result = await self.cache.get(self.user.email)
+        self.assertEqual(result.email, self.user.email)
+        self.assertEqual(self.cache.local.get(self.user.email), dump_user(self.user))
+
+    async def test_set_compares_version(self):
+        self.client.get.return_value = b"3"
+        version = await self.cache.version(self.user.email)
+        self.assertEqual(version, (0, 3))
+        self.client.eval.return_value = 0
+        await self.cache.set(self.user, version)
+        self.client.eval.assert_awaited_once_with(
+            UserCache.fill_script, 2, "user:test@example.com", "user-version:test@example.com", 3,
+            json.dumps(dump_user(self.user), separators=(",", ":")), 300)
+        self.client.set.assert_not_awaited()
+        self.assertIsNone(self.cache.local.get(self.user.email))
+        self.client.eval.return_value = 1
+        await self.cache.set(self.user, version)
+        self.assertEqual(self.cache.local.get(self.user.email), dump_user(self.user))
+
+    async def test_invalidate_bumps_version_before_delete(self):
+        await self.cache.invalidate(self.user.email)
+        self.assertEqual([call[0] for call in self.client.mock_calls], ["incr", "expire", "delete"])
+        self.client.incr.assert_awaited_once_with("user-version:test@example.com")
+        self.client.expire.assert_awaited_once_with("user-version:test@example.com", 300)
+
+    async def test_delete(self):
+        await self.cache.set(self.user)
+        await self.cache.delete(self.user.email)
+        self.client.delete.assert_awaited_once_with("user:test@example.com")
+        self.client.get.return_value = None
+        self.assertIsNone(await self.cache.get(self.user.email))
+
+
+class TestLRUCacheStats(unittest.TestCase):
+    def test_counts_hits_and_misses(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.get("a")
+        cache.set("a", 1)
+        cache.get("a")
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+
+class TestAsyncInvalidation(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.user = User(id=1, username="test", email="test@example.com", password="hash", avatar=None,
+                         confirmed=False)
+
+    async def test_invalidate_evicts_every_worker(self):
+        bus = LocalInvalidationBus()
+        workers = [UserCache(None, 300, LRUCache(10, 300), bus) for _ in range(2)]
+        for cache in workers:
+            await cache.set(self.user)
+        await workers[0].invalidate(self.user.email)
+        for cache in workers:
+            self.assertIsNone(await cache.get(self.user.email))
+
+    async def test_fill_after_invalidation_is_skipped(self):
+        bus = LocalInvalidationBus()
+        workers = [UserCache(None, 300, LRUCache(10, 300), bus) for _ in range(2)]
+        version = await workers[1].version(self.user.email)
+        await workers[0].invalidate(self.user.email)
+        await workers[1].set(self.user, version)
+        self.assertIsNone(await workers[1].get(self.user.email))
+        await workers[1].set(self.user, await workers[1].version(self.user.email))
+        self.assertIsNotNone(await workers[1].get(self.user.email))
+
+    async def test_evicted_invalidations_stay_conservative(self):
+        cache = UserCache(None, 300, LRUCache(2, 300))
+        version = await cache.version(self.user.email)
+        for email in (self.user.email, "a@example.com", "b@example.com"):
+            await cache.invalidate(email)
+        await cache.set(self.user, version)
+        self.assertIsNone(cache.local.get(self.user.email))
+
+    async def test_redis_bus_publishes_namespaced_key(self):
+        client = AsyncMock()
+        bus = RedisInvalidationBus(client, "channel")
+        cache = UserCache(client, 300, LRUCache(10, 300), bus)
+        await cache.set(self.user)
+        await cache.invalidate(self.user.email)
+        client.publish.assert_awaited_once_with("channel", "user:test@example.com")
+        self.assertIsNone(cache.local.get(self.user.email))
+
+    async def test_redis_bus_dispatches_received_message(self):
+        bus = RedisInvalidationBus(AsyncMock(), "channel")
+        cache = UserCache(None, 300, LRUCache(10, 300), bus)
+        await cache.set(self.user)
+        bus.dispatch(*"user:test@example.com".split(":", 1))
+        self.assertIsNone(cache.local.get(self.user.email))
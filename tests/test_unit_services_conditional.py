@@ -0,0 +1,49 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+from src.services.conditional import etag_matches, http_date, is_not_modified, last_modified, make_etag, \
+    version_etag
+
+
+class TestConditional(unittest.TestCase):
+    def test_etag_is_strong_and_stable(self):
+        etag = make_etag(b"[]")
+        self.assertEqual(etag, make_etag(b"[]"))
+        self.assertNotEqual(etag, make_etag(b"[1]"))
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+
+    def test_version_etag(self):
+        etag = version_etag("response:1:7:get_contacts:abc", "id", "first_name")
+        self.assertEqual(etag, version_etag("response:1:7:get_contacts:abc", "id", "first_name"))
+        self.assertNotEqual(etag, version_etag("response:1:8:get_contacts:abc", "id", "first_name"))
+        self.assertNotEqual(etag, version_etag("response:1:7:get_contacts:abc", "id"))
+
+    def test_etag_matches_needs_the_tag(self):
+        etag = make_etag(b"[]")
+        self.assertTrue(etag_matches({"if-none-match": f'"other", W/{etag}'}, etag))
+        self.assertFalse(etag_matches({"if-none-match": "*"}, etag))
+        self.assertFalse(etag_matches({}, etag))
+
+    def test_last_modified(self):
+        rows = [SimpleNamespace(updated_at=datetime(2026, 10, 1, 8)), SimpleNamespace(updated_at=None),
+                SimpleNamespace(updated_at=datetime(2026, 10, 18, 9, 30))]
+        self.assertEqual(last_modified(rows), "Sun, 18 Oct 2026 09:30:00 GMT")
+        self.assertIsNone(last_modified([]))
+
+    def test_if_none_match(self):
+        etag = make_etag(b"[]")
+        self.assertTrue(is_not_modified({"if-none-match": f'"other", {etag}'}, etag, None))
+        self.assertTrue(is_not_modified({"if-none-match": "*"}, etag, None))
+        self.assertFalse(is_not_modified({"if-none-match": '"other"'}, etag, None))
+
+    def test_if_modified_since(self):
+        modified = http_date(datetime(2026, 10, 18, 9, 30))
+        self.assertTrue(is_not_modified({"if-modified-since": modified}, None, modified))
+        self.assertFalse(is_not_modified({"if-modified-since": "Sun, 18 Oct 2026 09:29:59 GMT"}, None, modified))
+        self.assertFalse(is_not_modified({"if-modified-since": "garbage"}, None, modified))
+
+    def test_if_none_match_wins_over_if_modified_since(self):
+        modified = http_date(datetime(2026, 10, 18, 9, 30))
+        headers = {"if-none-match": '"other"', "if-modified-since": modified}
+        self.assertFalse(is_not_modified(headers, make_etag(b"[]"), modified))
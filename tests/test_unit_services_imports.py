@@ -0,0 +1,42 @@
+import io
+import unittest
+
+from src.services.imports import ContactImport, detect_format, parse_rows
+
+
+class TestParseRows(unittest.TestCase):
+    def test_detect_format(self):
+        self.assertEqual(detect_format("contacts.CSV", None), "csv")
+        self.assertEqual(detect_format("upload", "application/x-ndjson; charset=utf-8"), "ndjson")
+        self.assertIsNone(detect_format("contacts.txt", "text/plain"))
+
+    def test_csv_with_quoted_newline(self):
+        file = io.BytesIO('first_name,add_info\nann,"two\nlines"\nbob,x\n'.encode())
+        rows = list(parse_rows(file, "csv"))
+        self.assertEqual([number for number, _, _ in rows], [1, 2])
+        self.assertEqual(rows[0][1]["add_info"], "two\nlines")
+
+    def test_ndjson_errors(self):
+        rows = list(parse_rows(io.BytesIO(b'{"a": 1}\n\nnope\n'), "ndjson"))
+        self.assertEqual(rows[0], (1, {"a": 1}, None))
+        self.assertEqual(rows[1][0], 3)
+        self.assertIsNone(rows[1][1])
+
+    def test_invalid_utf8_ends_file(self):
+        rows = list(parse_rows(io.BytesIO(b'{"a": 1}\n{"b": "\xff"}\n'), "ndjson"))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][:2], (1, None))
+        self.assertIn("UTF-8", rows[0][2])
+
+
+class TestAsyncContactImport(unittest.IsolatedAsyncioTestCase):
+    async def test_batches_and_error_limit(self):
+        lines = [b'{"first_name": "a", "second_name": "b", "email": "c", "birthday": "1990-01-01", "add_info": "d"}']
+        file = io.BytesIO(b"\n".join(lines * 5 + [b"{}"] * 3))
+        contact_import = ContactImport(file, "ndjson", user_id=7, batch_size=2, max_errors=2)
+        batches = [batch async for batch in contact_import.batches()]
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[0][0].user_id, 7)
+        report = contact_import.report(5)
+        self.assertEqual(report["failed"], 3)
+        self.assertEqual([error["row"] for error in report["errors"]], [6, 7])
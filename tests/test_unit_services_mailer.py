@@ -0,0 +1,160 @@
+import asyncio
+import socket
+import unittest
+from email.message import EmailMessage
+from unittest.mock import patch
+
+import aiosmtplib
+from aiosmtpd.controller import Controller
+from aiosmtpd.handlers import Sink
+
+from src.services.mailer import SMTPMailer
+
+
+def make_message(number: int) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = "app@example.com"
+    message["To"] = f"user{number}@example.com"
+    message["Subject"] = f"message {number}"
+    message.set_content("hello")
+    return message
+
+
+class FakeSMTP:
+    instances = []
+    failures = 0
+    error = None
+    broken = None
+
+    def __init__(self, **options):
+        self.options = options
+        self.is_connected = False
+        self.messages = []
+        FakeSMTP.instances.append(self)
+
+    async def connect(self):
+        self.is_connected = True
+
+    async def login(self, username, password):
+        pass
+
+    async def send_message(self, message):
+        if message["Subject"] == FakeSMTP.broken:
+            raise ValueError("broken message")
+        if FakeSMTP.failures:
+            FakeSMTP.failures -= 1
+            if FakeSMTP.error is not None:
+                raise FakeSMTP.error
+            self.is_connected = False
+            raise aiosmtplib.SMTPServerDisconnected("gone")
+        self.messages.append(message)
+
+    async def quit(self):
+        self.is_connected = False
+
+    def close(self):
+        self.is_connected = False
+
+
+class TestAsyncSMTPMailer(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        FakeSMTP.instances = []
+        FakeSMTP.failures = 0
+        FakeSMTP.error = None
+        FakeSMTP.broken = None
+        self.mailer = SMTPMailer("localhost", 465, "user", "password", pool_size=2, batch_size=10, max_retries=2,
+                                 backoff=0.01, client_factory=FakeSMTP)
+
+    async def test_reuses_connections(self):
+        await self.mailer.start()
+        for number in range(20):
+            await self.mailer.enqueue(make_message(number))
+        await self.mailer.stop()
+        self.assertEqual(self.mailer.sent, 20)
+        self.assertLessEqual(self.mailer.connects, 2)
+        self.assertEqual(sum(len(client.messages) for client in FakeSMTP.instances), 20)
+        stats = self.mailer.stats()
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertGreater(stats["send_rate"], 0)
+
+    async def test_retries_with_backoff(self):
+        FakeSMTP.failures = 2
+        with patch("src.services.mailer.asyncio.sleep") as sleep_mock:
+            await self.mailer.start()
+            await self.mailer.enqueue(make_message(1))
+            await self.mailer.stop()
+        self.assertEqual(self.mailer.sent, 1)
+        self.assertEqual(self.mailer.retried, 2)
+        self.assertEqual([call.args[0] for call in sleep_mock.await_args_list], [0.01, 0.02])
+
+    async def test_gives_up_after_max_retries(self):
+        FakeSMTP.failures = 10
+        await self.mailer.start()
+        await self.mailer.enqueue(make_message(1))
+        await self.mailer.stop()
+        self.assertEqual((self.mailer.sent, self.mailer.failed, self.mailer.retried), (0, 1, 2))
+
+    async def test_permanent_rejection_fails_at_once(self):
+        FakeSMTP.failures = 2
+        FakeSMTP.error = aiosmtplib.SMTPRecipientsRefused(
+            [aiosmtplib.SMTPRecipientRefused(550, "no such user", "bad@example.com")])
+        await self.mailer.enqueue(make_message(1))
+        await self.mailer.enqueue(make_message(2))
+        await self.mailer.start()
+        await self.mailer.stop()
+        self.assertEqual((self.mailer.sent, self.mailer.failed, self.mailer.retried), (0, 2, 0))
+        self.assertEqual(self.mailer.connects, 1)
+
+    async def test_temporary_rejection_keeps_connection(self):
+        FakeSMTP.failures = 1
+        FakeSMTP.error = aiosmtplib.SMTPSenderRefused(451, "try again later", "app@example.com")
+        await self.mailer.start()
+        await self.mailer.enqueue(make_message(1))
+        await self.mailer.stop()
+        self.assertEqual((self.mailer.sent, self.mailer.retried, self.mailer.connects), (1, 1, 1))
+
+    async def test_unexpected_error_fails_only_its_message(self):
+        FakeSMTP.broken = "message 2"
+        self.mailer.pool_size = 1
+        for number in range(5):
+            await self.mailer.enqueue(make_message(number))
+        await self.mailer.start()
+        await asyncio.wait_for(self.mailer.stop(timeout=1), 0.5)
+        self.assertEqual((self.mailer.sent, self.mailer.failed), (4, 1))
+        delivered = [message["Subject"] for client in FakeSMTP.instances for message in client.messages]
+        self.assertNotIn("message 2", delivered)
+        self.assertEqual(self.mailer.stats()["queue_depth"], 0)
+
+    async def test_queue_depth_before_start(self):
+        await self.mailer.enqueue(make_message(1))
+        self.assertEqual(self.mailer.stats()["queue_depth"], 1)
+        await self.mailer.start()
+        await self.mailer.stop()
+        self.assertEqual(self.mailer.sent, 1)
+
+
+class TestAsyncSMTPMailerServer(unittest.IsolatedAsyncioTestCase):
+    async def test_delivers_to_smtp_server(self):
+        received = []
+
+        class Handler(Sink):
+            async def handle_DATA(self, server, session, envelope):
+                received.append(envelope)
+                return "250 OK"
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        controller = Controller(Handler(), hostname="127.0.0.1", port=port)
+        controller.start()
+        try:
+            mailer = SMTPMailer("127.0.0.1", port, use_tls=False, pool_size=2, batch_size=5)
+            await mailer.start()
+            for number in range(10):
+                await mailer.enqueue(make_message(number))
+            await mailer.stop()
+        finally:
+            controller.stop()
+        self.assertEqual(len(received), 10)
+        self.assertEqual(mailer.sent, 10)
+        self.assertLessEqual(mailer.connects, 2)
@@ -0,0 +1,55 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from src.conf.config import config
+from src.services.passwords import (PasswordHasher, PasswordPoolBusy, build_context, calibrate_rounds, get_rounds,
+                                    hash_password, verify_password)
+
+
+class TestAsyncPasswordHasher(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.hasher = PasswordHasher("thread", workers=1, max_pending=1)
+
+    def tearDown(self):
+        self.hasher.shutdown()
+
+    async def test_hash_and_verify(self):
+        hashed = await self.hasher.hash("secret")
+        self.assertTrue(await self.hasher.verify("secret", hashed))
+        self.assertFalse(await self.hasher.verify("wrong", hashed))
+
+    async def test_rejects_above_max_pending(self):
+        hashed = hash_password("secret")
+        running = asyncio.create_task(self.hasher.verify("secret", hashed))
+        await asyncio.sleep(0)
+        with self.assertRaises(PasswordPoolBusy):
+            await self.hasher.verify("secret", hashed)
+        self.assertTrue(await running)
+        self.assertEqual(self.hasher.pending, 0)
+
+    async def test_process_pool(self):
+        hasher = PasswordHasher("process", workers=1, max_pending=2)
+        try:
+            hashed = await hasher.hash("secret")
+        finally:
+            hasher.shutdown()
+        self.assertTrue(verify_password("secret", hashed))
+
+
+class TestBcryptCost(unittest.TestCase):
+    def test_get_rounds(self):
+        self.assertEqual(get_rounds(build_context(5).hash("secret")), 5)
+        self.assertIsNone(get_rounds("plain"))
+
+    def test_calibrate_picks_highest_cost_within_target(self):
+        with patch("src.services.passwords.measure_rounds", side_effect=lambda rounds: 2 ** rounds / 10000):
+            rounds, timings = calibrate_rounds(250, min_rounds=4, max_rounds=16)
+        self.assertEqual(rounds, 11)
+        self.assertEqual(max(timings), 11)
+
+    def test_context_marks_other_costs_for_update(self):
+        valid, new_hash = build_context(config.BCRYPT_ROUNDS).verify_and_update("secret",
+                                                                                build_context(4).hash("secret"))
+        self.assertTrue(valid)
+        self.assertEqual(get_rounds(new_hash), config.BCRYPT_ROUNDS)
@@ -0,0 +1,123 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError
+
+from src.services.rate_limit import RateLimit, TokenBucketLimiter
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def incrby(self, key, amount):
+        self.commands.append((key, amount))
+
+    def expire(self, key, seconds):
+        self.commands.append(None)
+
+    async def execute(self):
+        if self.redis.down:
+            raise ConnectionError("down")
+        results = []
+        for command in self.commands:
+            if command is None:
+                results.append(True)
+                continue
+            key, amount = command
+            self.redis.counters[key] = self.redis.counters.get(key, 0) + amount
+            results.append(self.redis.counters[key])
+        return results
+
+
+class FakeRedis:
+    def __init__(self):
+        self.counters = {}
+        self.down = False
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class TestTokenBucketLimiter(unittest.TestCase):
+    def setUp(self):
+        self.limiter = TokenBucketLimiter(None)
+
+    @patch("src.services.rate_limit.time.monotonic")
+    def test_allows_times_then_rejects(self, monotonic):
+        monotonic.return_value = 100.0
+        results = [self.limiter.acquire("key", 3, 30) for _ in range(4)]
+        self.assertEqual(results[:3], [0, 0, 0])
+        self.assertAlmostEqual(results[3], 10)
+        self.assertEqual(self.limiter.acquire("other", 3, 30), 0)
+
+    @patch("src.services.rate_limit.time.monotonic")
+    def test_refills(self, monotonic):
+        monotonic.return_value = 100.0
+        self.limiter.acquire("key", 1, 10)
+        self.assertGreater(self.limiter.acquire("key", 1, 10), 0)
+        monotonic.return_value = 110.0
+        self.assertEqual(self.limiter.acquire("key", 1, 10), 0)
+
+    def test_evicts_least_recently_used(self):
+        limiter = TokenBucketLimiter(None, size=2)
+        for key in ("a", "b", "c"):
+            limiter.acquire(key, 1, 10)
+        self.assertEqual(limiter.stats()["keys"], 2)
+        self.assertEqual(limiter.acquire("a", 1, 10), 0)
+
+
+class TestAsyncTokenBucketLimiter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.workers = [TokenBucketLimiter(self.redis), TokenBucketLimiter(self.redis)]
+
+    async def test_sync_applies_consumption_of_other_workers(self):
+        for _ in range(6):
+            self.assertEqual(self.workers[0].acquire("key", 10, 60), 0)
+        self.workers[1].acquire("key", 10, 60)
+        for worker in self.workers:
+            await worker.sync()
+        await self.workers[0].sync()
+        self.assertEqual(sum(self.redis.counters.values()), 7)
+        allowed = sum(1 for _ in range(10) if self.workers[1].acquire("key", 10, 60) == 0)
+        self.assertEqual(allowed, 3)
+        allowed = sum(1 for _ in range(10) if self.workers[0].acquire("key", 10, 60) == 0)
+        self.assertEqual(allowed, 3)
+        for worker in self.workers:
+            await worker.sync()
+        await self.workers[0].sync()
+        self.assertEqual(sum(self.redis.counters.values()), 13)
+
+    async def test_sync_error_keeps_consumption(self):
+        limiter = self.workers[0]
+        limiter.acquire("key", 10, 60)
+        self.redis.down = True
+        await limiter.sync()
+        self.assertEqual(limiter.stats()["sync_errors"], 1)
+        self.redis.down = False
+        await limiter.sync()
+        self.assertEqual(sum(self.redis.counters.values()), 1)
+
+    @patch("src.services.rate_limit.time.monotonic")
+    async def test_sync_drops_idle_buckets(self, monotonic):
+        monotonic.return_value = 100.0
+        limiter = self.workers[0]
+        limiter.acquire("key", 10, 60)
+        await limiter.sync()
+        monotonic.return_value = 200.0
+        await limiter.sync()
+        self.assertEqual(limiter.stats()["keys"], 0)
+
+    async def test_dependency_raises_429(self):
+        dependency = RateLimit(1, 10, scope="contacts", limiter=TokenBucketLimiter(None))
+        request = MagicMock(headers={"X-Forwarded-For": "10.0.0.1, 10.0.0.2"}, scope={"path": "/api/contacts/"})
+        await dependency(request)
+        with self.assertRaises(HTTPException) as error:
+            await dependency(request)
+        self.assertEqual(error.exception.status_code, 429)
+        self.assertEqual(error.exception.headers["Retry-After"], "10")
+        other = MagicMock(headers={"X-Forwarded-For": "10.0.0.3"}, scope={"path": "/api/contacts/"})
+        await dependency(other)
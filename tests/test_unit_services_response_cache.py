@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+from redis.exceptions import RedisError
+
+from src.services.cache import LRUCache
+from src.services.response_cache import ResponseCache
+
+
+class TestAsyncResponseCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = ResponseCache(None, 60, 0.5, LRUCache(10, 60), max_bytes=100)
+
+    async def test_bump_invalidates_user(self):
+        key = await self.cache.key(1, "get_contacts", {"limit": 10})
+        await self.cache.set(key, b"[]", {"X-Next-Cursor": "abc"})
+        self.assertEqual(await self.cache.get(key, "get_contacts"), (b"[]", {"X-Next-Cursor": "abc"}))
+        other_user = await self.cache.key(2, "get_contacts", {"limit": 10})
+        await self.cache.bump(1)
+        self.assertIsNone(await self.cache.get(await self.cache.key(1, "get_contacts", {"limit": 10}),
+                                               "get_contacts"))
+        self.assertEqual(await self.cache.key(2, "get_contacts", {"limit": 10}), other_user)
+        self.assertEqual(self.cache.stats()["routes"]["get_contacts"],
+                         {"hits": 1, "misses": 1, "hit_ratio": 0.5})
+
+    async def test_generation_seeded_on_first_write(self):
+        self.assertEqual(await self.cache.generation(1), 0)
+        await self.cache.bump(1)
+        first = await self.cache.generation(1)
+        self.assertGreater(first, 1)
+        await self.cache.bump(1)
+        self.assertEqual(await self.cache.generation(1), first + 1)
+        self.cache.clear()
+        await self.cache.bump(1)
+        self.assertGreater(await self.cache.generation(1), first + 1)
+
+    async def test_params_change_key(self):
+        first = await self.cache.key(1, "search", {"q": "john", "limit": 10})
+        self.assertEqual(first, await self.cache.key(1, "search", {"limit": 10, "q": "john"}))
+        self.assertNotEqual(first, await self.cache.key(1, "search", {"q": "jane", "limit": 10}))
+
+    async def test_skips_large_bodies(self):
+        key = await self.cache.key(1, "get_contacts", {})
+        await self.cache.set(key, b"x" * 101, {})
+        self.assertIsNone(await self.cache.get(key, "get_contacts"))
+
+    async def test_redis_ttl_jitter(self):
+        client = AsyncMock()
+        client.get.return_value = b"3"
+        cache = ResponseCache(client, 60, 0.5, LRUCache(10, 60), max_bytes=100)
+        key = await cache.key(1, "birthday", {"days": 7})
+        self.assertTrue(key.startswith("response:1:3:birthday:"))
+        await cache.set(key, b"{}", {})
+        self.assertTrue(60 <= client.set.call_args.kwargs["ex"] <= 90)
+        await cache.bump(1)
+        self.assertEqual(client.set.await_args_list[1].args[0], "response-generation:1")
+        self.assertTrue(client.set.await_args_list[1].kwargs["nx"])
+        client.incr.assert_awaited_once_with("response-generation:1")
+
+    async def test_settled_after_write(self):
+        cache = ResponseCache(None, 60, 0.5, LRUCache(10, 60), max_bytes=100, settle=0.05)
+        self.assertTrue(await cache.settled(1))
+        await cache.bump(1)
+        self.assertFalse(await cache.settled(1))
+        self.assertTrue(await cache.settled(2))
+        await asyncio.sleep(0.06)
+        self.assertTrue(await cache.settled(1))
+
+    async def test_redis_settled(self):
+        client = AsyncMock()
+        cache = ResponseCache(client, 60, 0.5, LRUCache(10, 60), max_bytes=100, settle=5)
+        await cache.bump(1)
+        client.set.assert_awaited_with("response-bumped:1", 1, px=5000)
+        client.exists.return_value = 1
+        self.assertFalse(await cache.settled(1))
+        client.exists.side_effect = RedisError("down")
+        self.assertFalse(await cache.settled(1))
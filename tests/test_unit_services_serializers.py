@@ -0,0 +1,37 @@
+import json
+import unittest
+from collections import namedtuple
+from datetime import date, datetime
+from unittest.mock import patch
+
+from src.schemas.contact import ContactResponse, ContactRowResponse
+from src.services.serializers import Renderer
+
+ContactRow = namedtuple("ContactRow", "id first_name second_name email birthday add_info user_id updated_at")
+
+
+class TestRenderer(unittest.TestCase):
+    def setUp(self):
+        self.rows = [ContactRow(i, f"first{i}", "second", f"contact{i}@example.com", date(1990, 1, i + 1), "info",
+                                1, datetime(2026, 10, 18)) for i in range(3)]
+
+    def test_fast_matches_validated(self):
+        for renderer, content in ((Renderer(ContactResponse, many=True), self.rows),
+                                  (Renderer(ContactResponse), self.rows[0]),
+                                  (Renderer(ContactRowResponse, many=True), self.rows),
+                                  (Renderer(ContactRowResponse, key="contacts"), {"contacts": self.rows})):
+            self.assertEqual(renderer.render(content, fast=True), renderer.render(content))
+
+    def test_fast_without_orjson(self):
+        renderer = Renderer(ContactRowResponse, key="contacts")
+        with patch("src.services.serializers.orjson", None):
+            body = renderer.render({"contacts": self.rows}, fast=True)
+        self.assertEqual(body, renderer.render({"contacts": self.rows}))
+        self.assertEqual(json.loads(body)["contacts"][0]["birthday"], "1990-01-01")
+
+    def test_fast_skips_validation(self):
+        row = self.rows[0]._replace(birthday=date(2999, 1, 1))
+        renderer = Renderer(ContactResponse)
+        self.assertEqual(json.loads(renderer.render(row, fast=True))["birthday"], "2999-01-01")
+        with self.assertRaises(ValueError):
+            renderer.render(row)
@@ -0,0 +1,82 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from redis.exceptions import ConnectionError
+
+from src.services.tokens import (InvalidRefreshToken, MemoryRefreshTokenStore, RedisRefreshTokenStore,
+                                 RefreshTokenReused, TokenStoreUnavailable)
+
+
+class TestAsyncMemoryRefreshTokenStore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.store = MemoryRefreshTokenStore(ttl=60)
+
+    async def test_rotate(self):
+        family, jti = await self.store.start()
+        new_jti = await self.store.rotate(family, jti)
+        self.assertNotEqual(new_jti, jti)
+        self.assertNotEqual(await self.store.rotate(family, new_jti), new_jti)
+
+    async def test_reuse_revokes_family(self):
+        family, jti = await self.store.start()
+        new_jti = await self.store.rotate(family, jti)
+        with self.assertRaises(RefreshTokenReused):
+            await self.store.rotate(family, jti)
+        with self.assertRaises(InvalidRefreshToken):
+            await self.store.rotate(family, new_jti)
+
+    async def test_unknown_family(self):
+        with self.assertRaises(InvalidRefreshToken):
+            await self.store.rotate("unknown", "jti")
+
+    @patch("src.services.cache.time.monotonic")
+    async def test_expired_families_are_dropped(self, monotonic):
+        monotonic.return_value = 1000.0
+        family, jti = await self.store.start()
+        await self.store.start()
+        monotonic.return_value = 1061.0
+        with self.assertRaises(InvalidRefreshToken):
+            await self.store.rotate(family, jti)
+        await self.store.start()
+        self.assertEqual(len(self.store._families), 1)
+
+    async def test_size_is_bounded(self):
+        store = MemoryRefreshTokenStore(ttl=60, size=2)
+        family, jti = await store.start()
+        await store.start()
+        await store.start()
+        self.assertEqual(len(store._families), 2)
+        with self.assertRaises(InvalidRefreshToken):
+            await store.rotate(family, jti)
+
+
+class TestAsyncRedisRefreshTokenStore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.set = AsyncMock()
+        self.script = AsyncMock()
+        self.client.register_script.return_value = self.script
+        self.store = RedisRefreshTokenStore(self.client, ttl=60)
+
+    async def test_start(self):
+        family, jti = await self.store.start()
+        self.client.set.assert_awaited_once_with(f"refresh:{family}", jti, ex=60)
+
+    async def test_rotate_results(self):
+        self.script.return_value = 1
+        new_jti = await self.store.rotate("family", "jti")
+        self.script.assert_awaited_once_with(keys=["refresh:family"], args=["jti", new_jti, 60])
+        self.script.return_value = -1
+        with self.assertRaises(RefreshTokenReused):
+            await self.store.rotate("family", "jti")
+        self.script.return_value = 0
+        with self.assertRaises(InvalidRefreshToken):
+            await self.store.rotate("family", "jti")
+
+    async def test_redis_unavailable(self):
+        self.client.set.side_effect = ConnectionError("down")
+        with self.assertRaises(TokenStoreUnavailable):
+            await self.store.start()
+        self.script.side_effect = ConnectionError("down")
+        with self.assertRaises(TokenStoreUnavailable):
+            await self.store.rotate("family", "jti")